@@ -0,0 +1,326 @@
+import heapq
+from typing import Callable, Hashable
+
+import numpy
+
+
+_LEAF_SIZE = 4
+# the tree is rebuilt once refits made its boxes this much bigger than after the build
+_DEGRADATION_LIMIT = 2.0
+# share of the items that may wait outside the tree (added or removed) before a rebuild
+_PENDING_LIMIT = 0.25
+# share of the items changed at once above which rebuilding is cheaper than refitting them
+_REFIT_LIMIT = 0.05
+
+
+def _surface_area(minimum: numpy.ndarray, maximum: numpy.ndarray) -> numpy.ndarray:
+    size = numpy.maximum(maximum - minimum, 0.0)
+    return 2.0 * (size[..., 0] * size[..., 1] + size[..., 1] * size[..., 2] + size[..., 2] * size[..., 0])
+
+
+def _box_distances(point: numpy.ndarray, minimum: numpy.ndarray, maximum: numpy.ndarray) -> numpy.ndarray:
+    return numpy.linalg.norm(numpy.maximum(numpy.maximum(minimum - point, point - maximum), 0.0), axis=-1)
+
+
+def _ray_box_entries(
+    origin: numpy.ndarray,
+    direction: numpy.ndarray,
+    minimum: numpy.ndarray,
+    maximum: numpy.ndarray,
+) -> numpy.ndarray:
+    # slab test: ray parameter where the ray enters each box, inf when it misses
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        inverse = 1.0 / direction
+        near = (minimum - origin) * inverse
+        far = (maximum - origin) * inverse
+
+    # a ray parallel to a slab either lies inside it or misses the box
+    parallel = direction == 0.0
+    inside = (origin >= minimum) & (origin <= maximum)
+    near = numpy.where(parallel, numpy.where(inside, -numpy.inf, numpy.inf), near)
+    far = numpy.where(parallel, numpy.where(inside, numpy.inf, -numpy.inf), far)
+
+    entry = numpy.maximum(numpy.minimum(near, far).max(axis=-1), 0.0)
+    exit = numpy.maximum(near, far).min(axis=-1)
+    # empty boxes (removed items, nodes without items) are stored as (inf, -inf)
+    empty = (minimum > maximum).any(axis=-1)
+    return numpy.where((entry <= exit) & ~empty, entry, numpy.inf)
+
+
+def _morton_codes(minimum: numpy.ndarray, maximum: numpy.ndarray) -> numpy.ndarray:
+    # box centers quantized to 10 bits per axis, with the bits interleaved
+    centers = (minimum + maximum) / 2
+    if not len(centers):
+        return numpy.empty(0, dtype=numpy.uint64)
+
+    low, high = centers.min(axis=0), centers.max(axis=0)
+    cells = ((centers - low) / numpy.where(high > low, high - low, 1.0) * 1023).astype(numpy.uint64)
+
+    for shift, mask in ((16, 0x030000FF), (8, 0x0300F00F), (4, 0x030C30C3), (2, 0x09249249)):
+        cells = (cells | (cells << numpy.uint64(shift))) & numpy.uint64(mask)
+    return (cells[:, 0] << numpy.uint64(2)) | (cells[:, 1] << numpy.uint64(1)) | cells[:, 2]
+
+
+# hierarchy of axis aligned boxes over arbitrary hashable items, built over
+# their Morton order; nodes are kept in flat arrays and queries walk the tree
+# one level at a time
+class BoundingVolumeHierarchy:
+    def __init__(self) -> None:
+        self._items: list[Hashable] = []
+        self._indexes: dict[Hashable, int] = {}
+        self._item_minimum = numpy.empty((0, 3))
+        self._item_maximum = numpy.empty((0, 3))
+        # items added since the last build are checked by brute force
+        self._pending: set[int] = set()
+        self._removed_amount = 0
+        self._build([])
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self._indexes
+
+    def _build(self, indexes: list[int]) -> None:
+        order = numpy.array(indexes, dtype=numpy.int64)
+        order = order[numpy.argsort(_morton_codes(self._item_minimum[order], self._item_maximum[order]), kind='stable')]
+
+        # the items sorted along the Morton curve are split in halves level by level,
+        # nodes are numbered breadth first so every parent is stored before its children
+        starts, ends, parents = [numpy.zeros(1, dtype=numpy.int64)], [numpy.array([len(order)])], [numpy.array([-1])]
+        levels = [numpy.zeros(1, dtype=numpy.int64)]
+        children = [numpy.full((1, 2), -1, dtype=numpy.int64)]
+        level_start, nodes_amount = 0, 1
+
+        while True:
+            level_starts, level_ends = starts[-1], ends[-1]
+            split = numpy.flatnonzero(level_ends - level_starts > _LEAF_SIZE)
+            if not len(split):
+                break
+
+            middles = (level_starts[split] + level_ends[split]) // 2
+            first_child = nodes_amount + 2 * numpy.arange(len(split))
+            children[-1][split] = numpy.stack([first_child, first_child + 1], axis=1)
+
+            starts.append(numpy.stack([level_starts[split], middles], axis=1).reshape(-1))
+            ends.append(numpy.stack([middles, level_ends[split]], axis=1).reshape(-1))
+            parents.append(numpy.repeat(level_start + split, 2))
+            children.append(numpy.full((2 * len(split), 2), -1, dtype=numpy.int64))
+            levels.append(numpy.arange(nodes_amount, nodes_amount + 2 * len(split)))
+            level_start, nodes_amount = nodes_amount, nodes_amount + 2 * len(split)
+
+        self._order = order
+        self._ranges = numpy.stack([numpy.concatenate(starts), numpy.concatenate(ends)], axis=1)
+        self._children = numpy.concatenate(children)
+        self._parents = numpy.concatenate(parents)
+        self._minimum = numpy.full((nodes_amount, 3), numpy.inf)
+        self._maximum = numpy.full((nodes_amount, 3), -numpy.inf)
+
+        # leaf boxes from their items, then the internal ones from the deepest level up
+        leaves = numpy.flatnonzero(self._children[:, 0] < 0)
+        filled = leaves[self._ranges[leaves, 1] > self._ranges[leaves, 0]]
+        filled = filled[numpy.argsort(self._ranges[filled, 0])]
+        if len(filled):
+            leaf_starts = self._ranges[filled, 0]
+            self._minimum[filled] = numpy.minimum.reduceat(self._item_minimum[order], leaf_starts)
+            self._maximum[filled] = numpy.maximum.reduceat(self._item_maximum[order], leaf_starts)
+
+        for level in reversed(levels):
+            inner = level[self._children[level, 0] >= 0]
+            left, right = self._children[inner, 0], self._children[inner, 1]
+            self._minimum[inner] = numpy.minimum(self._minimum[left], self._minimum[right])
+            self._maximum[inner] = numpy.maximum(self._maximum[left], self._maximum[right])
+
+        # filled leaves sorted by their ranges cover the whole order
+        sizes = self._ranges[filled, 1] - self._ranges[filled, 0]
+        self._leaf_of = dict(zip(order.tolist(), numpy.repeat(filled, sizes).tolist()))
+
+        self._pending.clear()
+        self._removed_amount = 0
+        self._area = float(_surface_area(self._minimum, self._maximum).sum())
+        self._built_area = self._area
+
+    def rebuild(self) -> None:
+        # drops the slots of removed items
+        indexes = numpy.fromiter(self._indexes.values(), dtype=numpy.int64, count=len(self._indexes))
+
+        self._items = list(self._indexes)
+        self._indexes = {item: i for i, item in enumerate(self._items)}
+        self._item_minimum = self._item_minimum[indexes].reshape(-1, 3)
+        self._item_maximum = self._item_maximum[indexes].reshape(-1, 3)
+        self._build(list(range(len(self._items))))
+
+    def _needs_rebuild(self) -> bool:
+        waiting = len(self._pending) + self._removed_amount
+        return (
+            waiting > max(_LEAF_SIZE, _PENDING_LIMIT * len(self._items))
+            or self._area > _DEGRADATION_LIMIT * max(self._built_area, 1e-12)
+        )
+
+    def insert(self, item: Hashable, minimum: numpy.ndarray, maximum: numpy.ndarray) -> None:
+        if item in self._indexes:
+            self.update(item, minimum, maximum)
+            return
+
+        index = len(self._items)
+
+        # item boxes grow by doubling, unused rows stay (inf, -inf)
+        if index == len(self._item_minimum):
+            extra = max(index, 16)
+            self._item_minimum = numpy.concatenate([self._item_minimum, numpy.full((extra, 3), numpy.inf)])
+            self._item_maximum = numpy.concatenate([self._item_maximum, numpy.full((extra, 3), -numpy.inf)])
+
+        self._items.append(item)
+        self._indexes[item] = index
+        self._item_minimum[index] = minimum
+        self._item_maximum[index] = maximum
+        self._pending.add(index)
+
+        if self._needs_rebuild():
+            self.rebuild()
+
+    # known items are refitted and new ones wait outside the tree like with `insert`,
+    # but the tree is rebuilt at most once
+    def insert_many(self, items: list[Hashable], minimum: numpy.ndarray, maximum: numpy.ndarray) -> None:
+        known = [i for i, item in enumerate(items) if item in self._indexes]
+        new = [i for i, item in enumerate(items) if item not in self._indexes]
+
+        indexes = numpy.array([self._indexes[items[i]] for i in known], dtype=numpy.int64)
+        self._item_minimum[indexes] = minimum[known]
+        self._item_maximum[indexes] = maximum[known]
+
+        first, needed = len(self._items), len(self._items) + len(new)
+        if needed > len(self._item_minimum):
+            extra = max(needed - len(self._item_minimum), len(self._item_minimum), 16)
+            self._item_minimum = numpy.concatenate([self._item_minimum, numpy.full((extra, 3), numpy.inf)])
+            self._item_maximum = numpy.concatenate([self._item_maximum, numpy.full((extra, 3), -numpy.inf)])
+
+        for index, i in enumerate(new, first):
+            self._items.append(items[i])
+            self._indexes[items[i]] = index
+        self._item_minimum[first:needed] = minimum[new]
+        self._item_maximum[first:needed] = maximum[new]
+        self._pending.update(range(first, needed))
+
+        refitted = [index for index in indexes.tolist() if index not in self._pending]
+        if len(refitted) > max(_LEAF_SIZE, _REFIT_LIMIT * len(self._items)):
+            self.rebuild()
+            return
+
+        for leaf in {self._leaf_of[index] for index in refitted}:
+            self._refit(leaf)
+
+        if self._needs_rebuild():
+            self.rebuild()
+
+    def remove(self, item: Hashable) -> None:
+        index = self._indexes.pop(item, None)
+        if index is None:
+            return
+
+        self._items[index] = None
+        self._item_minimum[index] = numpy.inf
+        self._item_maximum[index] = -numpy.inf
+
+        if index in self._pending:
+            self._pending.discard(index)
+        else:
+            self._refit(self._leaf_of.pop(index))
+            self._removed_amount += 1
+
+        if self._needs_rebuild():
+            self.rebuild()
+
+    def update(self, item: Hashable, minimum: numpy.ndarray, maximum: numpy.ndarray) -> None:
+        index = self._indexes[item]
+        self._item_minimum[index] = minimum
+        self._item_maximum[index] = maximum
+
+        if index not in self._pending:
+            self._refit(self._leaf_of[index])
+
+            if self._needs_rebuild():
+                self.rebuild()
+
+    # recomputes the box of a leaf and of its ancestors, stops where nothing changes
+    def _refit(self, node: int) -> None:
+        start, end = self._ranges[node]
+        items = self._order[start:end]
+        minimum, maximum = self._item_minimum[items].min(axis=0), self._item_maximum[items].max(axis=0)
+
+        while node >= 0:
+            if numpy.array_equal(minimum, self._minimum[node]) and numpy.array_equal(maximum, self._maximum[node]):
+                return
+
+            self._area += float(_surface_area(minimum, maximum) - _surface_area(self._minimum[node], self._maximum[node]))
+            self._minimum[node], self._maximum[node] = minimum, maximum
+
+            node = int(self._parents[node])
+            if node >= 0:
+                left, right = self._children[node]
+                minimum = numpy.minimum(self._minimum[left], self._minimum[right])
+                maximum = numpy.maximum(self._maximum[left], self._maximum[right])
+
+    def _candidates(self, test: Callable[[numpy.ndarray, numpy.ndarray], numpy.ndarray]) -> numpy.ndarray:
+        # items of the leaves whose boxes pass the test, plus the pending items
+        found = [numpy.fromiter(self._pending, dtype=numpy.int64)]
+        nodes = numpy.zeros(1, dtype=numpy.int64)
+
+        while len(nodes):
+            nodes = nodes[test(self._minimum[nodes], self._maximum[nodes])]
+            leaves = self._children[nodes, 0] < 0
+
+            for start, end in self._ranges[nodes[leaves]]:
+                found.append(self._order[start:end])
+            nodes = self._children[nodes[~leaves]].reshape(-1)
+
+        indexes = numpy.concatenate(found)
+        return indexes[test(self._item_minimum[indexes], self._item_maximum[indexes])]
+
+    # items whose boxes pass `test`, a function from (N, 3) minimum and maximum arrays to a mask
+    def query(self, test: Callable[[numpy.ndarray, numpy.ndarray], numpy.ndarray]) -> list[Hashable]:
+        return [self._items[index] for index in self._candidates(test)]
+
+    # items whose boxes are hit by the ray, ordered by the distance to the box entry
+    def ray_cast(self, origin: numpy.ndarray, direction: numpy.ndarray) -> list[tuple[float, Hashable]]:
+        origin, direction = numpy.asarray(origin, dtype=numpy.float64), numpy.asarray(direction, dtype=numpy.float64)
+        indexes = self._candidates(
+            lambda minimum, maximum: numpy.isfinite(_ray_box_entries(origin, direction, minimum, maximum))
+        )
+        entries = _ray_box_entries(origin, direction, self._item_minimum[indexes], self._item_maximum[indexes])
+        return [(float(entries[i]), self._items[indexes[i]]) for i in numpy.argsort(entries, kind='stable')]
+
+    # the item with the closest box, 0 distance when the point is inside it
+    def nearest(self, point: numpy.ndarray) -> tuple[float, Hashable] | None:
+        point = numpy.asarray(point, dtype=numpy.float64)
+        best: tuple[float, int] | None = None
+
+        if self._pending:
+            pending = numpy.fromiter(self._pending, dtype=numpy.int64)
+            distances = _box_distances(point, self._item_minimum[pending], self._item_maximum[pending])
+            best = (float(distances.min()), int(pending[distances.argmin()]))
+
+        # best first search, nodes are ordered by the distance to their boxes
+        queue = [(float(_box_distances(point, self._minimum[0], self._maximum[0])), 0)]
+
+        while queue:
+            distance, node = heapq.heappop(queue)
+            if best is not None and distance >= best[0]:
+                break
+
+            left, right = self._children[node]
+            if left < 0:
+                start, end = self._ranges[node]
+                items = self._order[start:end]
+                distances = _box_distances(point, self._item_minimum[items], self._item_maximum[items])
+
+                if len(items) and (best is None or distances.min() < best[0]):
+                    best = (float(distances.min()), int(items[distances.argmin()]))
+                continue
+
+            for child in (left, right):
+                heapq.heappush(queue, (float(_box_distances(point, self._minimum[child], self._maximum[child])), int(child)))
+
+        if best is None or not numpy.isfinite(best[0]):
+            return None
+        return best[0], self._items[best[1]]
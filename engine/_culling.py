@@ -0,0 +1,102 @@
+import numpy
+
+from . import scene, _projection
+from .mesh import Bounds, Mesh
+
+
+# the shader pushes vertexes along the normal and the y axis by this much per unit
+_SHADER_OFFSET = 0.00001
+
+
+def model_matrices(instances: numpy.ndarray) -> numpy.ndarray:
+    # instance rows keep the model matrix column-major
+    return instances[:, 0:16].reshape(-1, 4, 4).transpose(0, 2, 1).astype(numpy.float64)
+
+
+def mirrored_instances(instances: numpy.ndarray) -> numpy.ndarray:
+    return numpy.linalg.det(model_matrices(instances)[:, :3, :3]) < 0.0
+
+
+def _offset_margin(instances: numpy.ndarray, bounds: Bounds) -> numpy.ndarray:
+    specular = numpy.where(instances[:, 29] < 0.0, bounds.max_specular, instances[:, 29])
+    return _SHADER_OFFSET * (1.0 + numpy.abs(specular))
+
+
+# returns the mask of instances whose bounds may reach the screen
+def visible_instances(
+    instances: numpy.ndarray,
+    bounds: Bounds,
+    scale: tuple[float, float],
+    window: tuple[float, float, float, float] = _projection.FULL_VIEW,
+) -> numpy.ndarray:
+    models = model_matrices(instances)
+    rotations, translations = models[:, :3, :3], models[:, :3, 3]
+    margins = _offset_margin(instances, bounds)
+
+    # bounding sphere first: cheap rejection of everything beyond the depth range
+    centers = rotations @ bounds.center + translations
+    radiuses = bounds.radius * numpy.linalg.norm(rotations, axis=1).max(axis=1) + margins
+    visible = numpy.abs(centers[:, 2]) - radiuses <= _projection.DEPTH_RANGE
+
+    # spheres crossing the camera plane can't be culled by their projection
+    candidates = numpy.flatnonzero(visible & (numpy.abs(centers[:, 2]) > radiuses))
+    if not len(candidates):
+        return visible
+
+    corners = numpy.einsum('nij,kj->nki', rotations[candidates], bounds.corners) + translations[candidates, None, :]
+    minimum = corners.min(axis=1) - margins[candidates, None]
+    maximum = corners.max(axis=1) + margins[candidates, None]
+
+    visible[candidates] = _projection.visible_boxes(minimum, maximum, scale, window)
+    return visible
+
+
+def cull(
+    meshes: tuple[scene.DumpedMesh, ...],
+    view_size: tuple[float, float],
+    window: tuple[float, float, float, float] = _projection.FULL_VIEW,
+) -> tuple[tuple[scene.DumpedMesh, ...], int]:
+    scale = _projection.view_scale(view_size)
+    result = []
+    culled_amount = 0
+
+    for dumped_mesh in meshes:
+        bounds = dumped_mesh.mesh.bounds
+
+        # meshes without known bounds (e.g. a stream that just started) are always drawn
+        if bounds is None:
+            result.append(dumped_mesh)
+            continue
+
+        visible = visible_instances(dumped_mesh.instances, bounds, scale, window)
+        culled_amount += int(len(visible) - visible.sum())
+
+        if visible.all():
+            result.append(dumped_mesh)
+        elif visible.any():
+            result.append(scene.DumpedMesh(
+                dumped_mesh.mesh,
+                tuple(obj for obj, keep in zip(dumped_mesh.objects, visible) if keep),
+                dumped_mesh.instances[visible],
+            ))
+
+    return tuple(result), culled_amount
+
+
+# indexes of the triangles facing the camera (or facing away when `front` is False);
+# the camera is fixed at the world origin, so it is tested in model space
+# and the result stays valid until the object moves
+def facing_triangles(mesh: Mesh, model: numpy.ndarray, clockwise: bool, front: bool = True) -> numpy.ndarray:
+    model = model.astype(numpy.float64)
+    if abs(numpy.linalg.det(model[:3, :3])) < 1e-12:
+        return mesh.indexes
+
+    camera = numpy.linalg.solve(model[:3, :3], -model[:3, 3])
+    normals, offsets = mesh.face_planes
+
+    # clockwise front faces have their normals pointing inside; the side of a plane
+    # the camera is on does not depend on the transform, mirroring included
+    sign = -1.0 if clockwise else 1.0
+    facing = sign * (normals @ camera - offsets) > 0.0
+
+    return mesh.indexes.reshape(-1, 3)[facing == front].reshape(-1)
@@ -1,63 +1,82 @@
 from dataclasses import dataclass
+from typing import ClassVar, Iterable
 
-import moderngl
-from . import _common, types
+import numpy
+from . import types
 
-_context = _common.create_context()
+
+# the render shader evaluates every light in one pass, so the amount of lights
+# is bounded by the size of its uniform arrays; keep it equal to MAX_LIGHTS
+# in shaders/render/vertex.glsl
+MAX_LIGHTS = 16
+
+
+class TooManyLights(Exception):
+    __tmp: str = "Can't render {amount} lights, at most {max_amount} are supported"
+
+    def __init__(self, amount: int) -> None:
+        self.amount = amount
+        super().__init__(self.__tmp.format(amount=amount, max_amount=MAX_LIGHTS))
 
 
 @dataclass
 class Light:
     intensity: float
 
+    # light type id understood by the render shader
+    _type: ClassVar[int]
+
+    def _vector(self) -> types.Vector3:
+        return types.Vector3(0.0, 0.0, 0.0)
+
 
 @dataclass
 class AmbientLight(Light):
-    _program: moderngl.Program = _context.program(
-        **_common.load_shader('ambient_light'),
-        varyings=['out_vert', 'out_normal', 'out_color', 'out_intensity', 'out_specular'],
-    )
-
-    def transform(self, in_buffer: moderngl.Buffer, out_buffer: moderngl.Buffer) -> None:
-        self._program['intensity'] = self.intensity
-        arr = _context.vertex_array(
-            self._program, in_buffer,
-            'in_vert', 'in_normal', 'in_color', 'in_intensity', 'in_specular',
-        )
-        arr.transform(out_buffer)
+    _type: ClassVar[int] = 0
 
 
 @dataclass
 class PointLight(Light):
     position: types.Vector3
-    _program: moderngl.Program = _context.program(
-        **_common.load_shader('point_light'),
-        varyings=['out_vert', 'out_normal', 'out_color', 'out_intensity', 'out_specular'],
-    )
+    _type: ClassVar[int] = 1
 
-    def transform(self, in_buffer: moderngl.Buffer, out_buffer: moderngl.Buffer) -> None:
-        self._program['intensity'] = self.intensity
-        self._program['position'] = tuple(self.position)
-        arr = _context.vertex_array(
-            self._program, in_buffer,
-            'in_vert', 'in_normal', 'in_color', 'in_intensity', 'in_specular',
-        )
-        arr.transform(out_buffer)
+    def _vector(self) -> types.Vector3:
+        return self.position
 
 
 @dataclass
 class DirectionalLight(Light):
     direction: types.Vector3
-    _program: moderngl.Program = _context.program(
-        **_common.load_shader('direction_light'),
-        varyings=['out_vert', 'out_normal', 'out_color', 'out_intensity', 'out_specular'],
+    _type: ClassVar[int] = 2
+
+    def _vector(self) -> types.Vector3:
+        return self.direction
+
+
+@dataclass
+class PackedLights:
+    amount: int
+    types: numpy.ndarray
+    intensities: numpy.ndarray
+    vectors: numpy.ndarray
+
+
+def pack(lights: Iterable[Light]) -> PackedLights:
+    lights = tuple(lights)
+
+    if len(lights) > MAX_LIGHTS:
+        raise TooManyLights(len(lights))
+
+    packed = PackedLights(
+        amount=len(lights),
+        types=numpy.zeros(MAX_LIGHTS, dtype=numpy.int32),
+        intensities=numpy.zeros(MAX_LIGHTS, dtype=numpy.float32),
+        vectors=numpy.zeros((MAX_LIGHTS, 3), dtype=numpy.float32),
     )
 
-    def transform(self, in_buffer: moderngl.Buffer, out_buffer: moderngl.Buffer) -> None:
-        self._program['intensity'] = self.intensity
-        self._program['direction'] = tuple(self.direction)
-        arr = _context.vertex_array(
-            self._program, in_buffer,
-            'in_vert', 'in_normal', 'in_color', 'in_intensity', 'in_specular',
-        )
-        arr.transform(out_buffer)
+    for i, light in enumerate(lights):
+        packed.types[i] = light._type
+        packed.intensities[i] = light.intensity
+        packed.vectors[i] = list(light._vector())
+
+    return packed
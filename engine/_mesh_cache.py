@@ -0,0 +1,136 @@
+import json
+import os
+import struct
+import tempfile
+from pathlib import Path
+
+import numpy
+
+from .mesh import Mesh
+
+
+# bump whenever the parser starts producing different meshes from the same file
+_FORMAT_VERSION = 2
+_MAGIC = b'CGMESH\0\0'
+_PREAMBLE = struct.Struct('<8sII')  # magic, format version, header length
+_ALIGNMENT = 64
+_ARRAYS = ('positions', 'normals', 'colors', 'specular', 'indexes')
+
+
+def sidecar_path(source: Path) -> Path:
+    return source.with_name(f'{source.name}.meshcache')
+
+
+def _source_key(source: Path) -> dict:
+    stat = source.stat()
+    return {'source': str(source.resolve()), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+# material libraries change the colors too, one created after the model was cached as well
+def _library_key(library: Path) -> dict:
+    try:
+        return _source_key(library)
+    except OSError:
+        return {'source': str(library.resolve()), 'missing': True}
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+# the arrays have to fit in the file, and the stored maximum index has to point at
+# a vertex: indexes of a cached mesh are not read back to check them
+def _consistent(header: dict, data_start: int, file_size: int) -> bool:
+    descriptions = header['arrays']
+
+    for name in _ARRAYS:
+        description = descriptions[name]
+        nbytes = int(numpy.prod(description['shape'])) * numpy.dtype(description['dtype']).itemsize
+        if data_start + description['offset'] + nbytes > file_size:
+            return False
+
+    vertexes_amount = descriptions['positions']['shape'][0]
+    return not descriptions['indexes']['shape'][0] or 0 <= header['index_maximum'] < vertexes_amount
+
+
+# a sidecar that is stale, truncated or corrupt is a cache miss
+def load(source: Path) -> Mesh | None:
+    path = sidecar_path(source)
+
+    try:
+        with path.open('rb') as file:
+            magic, version, header_length = _PREAMBLE.unpack(file.read(_PREAMBLE.size))
+            if magic != _MAGIC or version != _FORMAT_VERSION:
+                return None
+            header = json.loads(file.read(header_length))
+        file_size = path.stat().st_size
+
+        if header['key'] != _source_key(source):
+            return None
+        if any(key != _library_key(Path(key['source'])) for key in header['libraries']):
+            return None
+
+        data_start = _align(_PREAMBLE.size + header_length)
+        if not _consistent(header, data_start, file_size):
+            return None
+
+        arrays = {}
+
+        for name in _ARRAYS:
+            description = header['arrays'][name]
+            shape = tuple(description['shape'])
+
+            # numpy.memmap can't map zero bytes
+            if 0 in shape:
+                arrays[name] = numpy.empty(shape, dtype=description['dtype'])
+            else:
+                arrays[name] = numpy.memmap(
+                    path, dtype=description['dtype'], mode='r',
+                    offset=data_start + description['offset'], shape=shape,
+                )
+
+        return Mesh(**arrays, _trusted=True)
+    except (OSError, struct.error, ValueError, KeyError, TypeError):
+        return None
+
+
+# the sidecar is written next to the source when the directory is writable,
+# through a temporary file so concurrent readers never see it half written
+def store(source: Path, mesh: Mesh, libraries: list[Path] = ()) -> None:
+    arrays = {name: numpy.ascontiguousarray(getattr(mesh, name)) for name in _ARRAYS}
+    descriptions = {}
+    offset = 0
+
+    for name, array in arrays.items():
+        descriptions[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset = _align(offset + array.nbytes)
+
+    # array offsets are relative to the aligned end of the header
+    header_data = json.dumps({
+        'key': _source_key(source),
+        'libraries': [_library_key(library) for library in libraries],
+        'arrays': descriptions,
+        'index_maximum': int(arrays['indexes'].max()) if len(arrays['indexes']) else -1,
+    }).encode()
+    data_start = _align(_PREAMBLE.size + len(header_data))
+    path = sidecar_path(source)
+
+    try:
+        descriptor, temporary_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+    except OSError:
+        return
+
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(_PREAMBLE.pack(_MAGIC, _FORMAT_VERSION, len(header_data)))
+            file.write(header_data)
+
+            for name, array in arrays.items():
+                file.seek(data_start + descriptions[name]['offset'])
+                array.tofile(file)
+
+        # mkstemp creates owner-only files, other processes should map the sidecar too
+        os.chmod(temporary_path, 0o644)
+        os.replace(temporary_path, path)
+    except OSError:
+        Path(temporary_path).unlink(missing_ok=True)
@@ -0,0 +1,495 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+from typing import Iterator
+
+import numpy
+
+from .mesh import Mesh
+
+
+_WHITESPACE = numpy.zeros(256, dtype=bool)
+_WHITESPACE[list(b' \t\n\r\v\f')] = True
+
+_OTHER, _VERTEX, _NORMAL, _FACE = range(4)
+
+# records parsed line by line; they are rare compared to v/vn/f
+_MATERIAL_KEYWORDS = (b'usemtl', b'newmtl', b'Kd', b'mtllib')
+
+
+class ObjParseError(Exception):
+    __tmp: str = "Can't parse OBJ data: {reason}"
+
+    def __init__(self, reason: str) -> None:
+        self.reason = reason
+        super().__init__(self.__tmp.format(reason=reason))
+
+
+@dataclass
+class ParsedChunk:
+    positions: numpy.ndarray
+    normals: numpy.ndarray
+    face_sizes: numpy.ndarray
+    # 0-based indexes; negative OBJ indexes are resolved against the records
+    # of this chunk only and marked as relative, so they can be shifted by
+    # the amount of records in the preceding chunks
+    corner_positions: numpy.ndarray
+    corner_positions_relative: numpy.ndarray
+    # -1 for corners without a normal
+    corner_normals: numpy.ndarray
+    corner_normals_relative: numpy.ndarray
+    # indexes into material_names, -1 for faces before the first usemtl of the chunk
+    face_materials: numpy.ndarray
+    material_names: list[str] = field(default_factory=list)
+    # inline newmtl/Kd records, kept as text since a definition may span chunks
+    material_lines: list[str] = field(default_factory=list)
+    mtllibs: list[str] = field(default_factory=list)
+
+
+def parse_materials(lines: list[str], materials: dict[str, tuple[float, float, float]]) -> None:
+    current_material = None
+
+    for line in lines:
+        object_type, *data = line.split() or ['']
+
+        if object_type == 'newmtl' and data:
+            current_material = data[0]
+            materials.setdefault(current_material, (0.0, 0.0, 0.0))
+        elif object_type == 'Kd' and current_material is not None:
+            materials[current_material] = tuple(map(float, data[:3]))
+
+
+@dataclass
+class _Tokens:
+    buffer: numpy.ndarray
+    starts: numpy.ndarray
+    ends: numpy.ndarray
+    records: numpy.ndarray
+    # per record: position of the keyword in the buffer and the record type
+    keywords: numpy.ndarray
+    keyword_tokens: numpy.ndarray
+    record_types: numpy.ndarray
+
+
+def _tokenize(data: bytes) -> _Tokens:
+    # the whole chunk is handled as one byte array, tokens are located with whitespace masks
+    buffer = numpy.frombuffer(data + b'\n\n\n', dtype=numpy.uint8)
+    whitespace = _WHITESPACE[buffer]
+
+    token_starts = numpy.flatnonzero(~whitespace[1:] & whitespace[:-1]) + 1
+    if len(buffer) and not whitespace[0]:
+        token_starts = numpy.concatenate([[0], token_starts])
+    token_ends = numpy.flatnonzero(~whitespace[:-1] & whitespace[1:]) + 1
+
+    newlines = numpy.flatnonzero(buffer == ord('\n'))
+    token_lines = numpy.searchsorted(newlines, token_starts)
+
+    # records are the lines which have at least one token, the first token is the keyword
+    is_keyword = numpy.ones(len(token_starts), dtype=bool)
+    is_keyword[1:] = token_lines[1:] != token_lines[:-1]
+    keyword_tokens = numpy.flatnonzero(is_keyword)
+    keywords = token_starts[keyword_tokens]
+
+    first, second, third = buffer[keywords], buffer[keywords + 1], buffer[keywords + 2]
+    record_types = numpy.full(len(keywords), _OTHER, dtype=numpy.int8)
+    record_types[(first == ord('v')) & _WHITESPACE[second]] = _VERTEX
+    record_types[(first == ord('v')) & (second == ord('n')) & _WHITESPACE[third]] = _NORMAL
+    record_types[(first == ord('f')) & _WHITESPACE[second]] = _FACE
+
+    return _Tokens(
+        buffer=buffer,
+        starts=token_starts,
+        ends=token_ends,
+        records=numpy.cumsum(is_keyword) - 1,
+        keywords=keywords,
+        keyword_tokens=keyword_tokens,
+        record_types=record_types,
+    )
+
+
+def count_chunk(data: bytes) -> tuple[int, int, int]:
+    # amounts of vertexes, normals and triangles, without reading any numbers
+    tokens = _tokenize(data)
+    face_records = tokens.records[tokens.record_types[tokens.records] == _FACE]
+    face_sizes = numpy.bincount(face_records)[numpy.unique(face_records)] - 1
+
+    return (
+        int((tokens.record_types == _VERTEX).sum()),
+        int((tokens.record_types == _NORMAL).sum()),
+        int(numpy.maximum(face_sizes - 2, 0).sum()),
+    )
+
+
+def read_blocks(path: Path, block_size: int, start: int = 0, end: int | None = None) -> Iterator[tuple[int, bytes]]:
+    # yields (offset, data) blocks of about block_size bytes cut at line ends;
+    # a range starting inside a line skips it, the range covering its start reads it whole
+    with path.open('rb') as file:
+        if start > 0:
+            file.seek(start - 1)
+            start += len(file.readline()) - 1
+
+        end = end if end is not None else path.stat().st_size
+        offset = start
+
+        while offset < end:
+            file.seek(offset)
+            data = file.read(min(block_size, end - offset))
+
+            if offset + len(data) < end:
+                cut = data.rfind(b'\n') + 1
+                data = data[:cut] if cut else data + file.readline()
+            elif not data.endswith(b'\n'):
+                data += file.readline()
+
+            if not data:
+                break
+
+            yield offset, data
+            offset += len(data)
+
+
+def parse_chunk(data: bytes) -> ParsedChunk:
+    # every number of the v, vn and f records is read by a single
+    # numpy.fromstring call over a copy where everything else is blanked
+    tokens = _tokenize(data)
+    buffer, token_starts, token_ends = tokens.buffer, tokens.starts, tokens.ends
+    token_records, keyword_tokens = tokens.records, tokens.keyword_tokens
+    keywords, record_types = tokens.keywords, tokens.record_types
+
+    token_types = record_types[token_records]
+    token_places = numpy.arange(len(token_starts)) - keyword_tokens[token_records]
+
+    is_coordinate = ((token_types == _VERTEX) | (token_types == _NORMAL)) & (token_places >= 1) & (token_places <= 3)
+    is_corner = (token_types == _FACE) & (token_places >= 1)
+    selected = is_coordinate | is_corner
+
+    # corner tokens look like v, v/vt, v/vt/vn or v//vn
+    slashes_positions = numpy.flatnonzero(buffer == ord('/'))
+    slashes_tokens = numpy.searchsorted(token_starts, slashes_positions, side='right') - 1
+    slashes = numpy.bincount(slashes_tokens, minlength=len(token_starts))
+    doubles = numpy.zeros(len(token_starts), dtype=bool)
+    doubles[slashes_tokens[buffer[slashes_positions + 1] == ord('/')]] = True
+
+    numbers_per_token = numpy.where(is_corner, 1 + slashes - doubles, 1)[selected]
+
+    marks = numpy.zeros(len(buffer) + 1, dtype=numpy.int8)
+    marks[token_starts[selected]] = 1
+    marks[token_ends[selected]] = -1
+    text = buffer.copy()
+    text[numpy.cumsum(marks[:-1], dtype=numpy.int8) == 0] = ord(' ')
+    text[text == ord('/')] = ord(' ')
+
+    numbers = numpy.fromstring(text.tobytes(), sep=' ') if len(numbers_per_token) else numpy.empty(0)
+
+    if len(numbers) != numbers_per_token.sum():
+        raise ObjParseError('malformed v, vn or f record')
+
+    offsets = numpy.zeros(len(token_starts), dtype=numpy.int64)
+    offsets[selected] = numpy.cumsum(numbers_per_token) - numbers_per_token
+
+    positions = _read_coordinates(numbers, offsets, is_coordinate & (token_types == _VERTEX), token_records)
+    normals = _read_coordinates(numbers, offsets, is_coordinate & (token_types == _NORMAL), token_records)
+
+    corner_tokens = numpy.flatnonzero(is_corner)
+    corner_records = token_records[corner_tokens]
+    face_records, face_sizes = numpy.unique(corner_records, return_counts=True)
+
+    positions_before = numpy.cumsum(record_types == _VERTEX) - (record_types == _VERTEX)
+    normals_before = numpy.cumsum(record_types == _NORMAL) - (record_types == _NORMAL)
+
+    raw_positions = numbers[offsets[corner_tokens]].astype(numpy.int64)
+    normal_places = numpy.where(doubles[corner_tokens], 1, 2)
+    has_normal = slashes[corner_tokens] == 2
+    raw_normals = numpy.where(
+        has_normal,
+        numbers[offsets[corner_tokens] + numpy.where(has_normal, normal_places, 0)],
+        0,
+    ).astype(numpy.int64)
+
+    if (raw_positions == 0).any():
+        raise ObjParseError('face refers to vertex 0')
+
+    chunk = ParsedChunk(
+        positions=positions,
+        normals=normals,
+        face_sizes=face_sizes,
+        corner_positions=_resolve_indexes(raw_positions, positions_before[corner_records]),
+        corner_positions_relative=raw_positions < 0,
+        corner_normals=numpy.where(has_normal, _resolve_indexes(raw_normals, normals_before[corner_records]), -1),
+        corner_normals_relative=has_normal & (raw_normals < 0),
+        face_materials=numpy.empty(0, dtype=numpy.int64),
+    )
+
+    usemtl_records = _read_material_records(data, buffer, keywords, record_types, chunk)
+    chunk.face_materials = numpy.searchsorted(usemtl_records, face_records, side='right') - 1
+
+    return chunk
+
+
+def _read_coordinates(numbers, offsets, is_coordinate, token_records) -> numpy.ndarray:
+    tokens = numpy.flatnonzero(is_coordinate)
+
+    if len(tokens) and (numpy.unique(token_records[tokens], return_counts=True)[1] != 3).any():
+        raise ObjParseError('v and vn records need three coordinates')
+
+    return numbers[offsets[tokens]].astype(numpy.float32).reshape(-1, 3)
+
+
+def _resolve_indexes(raw: numpy.ndarray, records_before: numpy.ndarray) -> numpy.ndarray:
+    return numpy.where(raw > 0, raw - 1, records_before + raw)
+
+
+def _read_material_records(data, buffer, keywords, record_types, chunk: ParsedChunk) -> numpy.ndarray:
+    candidates = numpy.flatnonzero((record_types == _OTHER) & numpy.isin(buffer[keywords], list(b'umnK')))
+    usemtl_records = []
+
+    for record in candidates:
+        start = keywords[record]
+        end = data.find(b'\n', start)
+        line = data[start:end if end >= 0 else len(data)]
+
+        if not line.startswith(_MATERIAL_KEYWORDS):
+            continue
+
+        object_type, *values = line.decode('utf-8', errors='replace').split()
+
+        if object_type == 'usemtl' and values:
+            usemtl_records.append(record)
+            chunk.material_names.append(values[0])
+        elif object_type == 'mtllib':
+            chunk.mtllibs.extend(values)
+        elif object_type in ('newmtl', 'Kd'):
+            chunk.material_lines.append(' '.join([object_type, *values]))
+
+    return numpy.array(usemtl_records, dtype=numpy.int64)
+
+
+def _unique_rows(columns: list[numpy.ndarray]) -> tuple[numpy.ndarray, numpy.ndarray]:
+    # packs the columns into one int64 key when it fits, which is much
+    # faster than numpy.unique over rows
+    bounds = [int(column.max()) + 2 if len(column) else 1 for column in columns]
+
+    if numpy.prod(bounds, dtype=float) < 2 ** 62:
+        keys = numpy.zeros(len(columns[0]), dtype=numpy.int64)
+
+        for column, bound in zip(columns, bounds):
+            keys = keys * bound + (column + 1)
+
+        keys, inverse = numpy.unique(keys, return_inverse=True)
+        rows = []
+
+        for bound in reversed(bounds):
+            keys, column = numpy.divmod(keys, bound)
+            rows.append(column - 1)
+
+        return numpy.stack(rows[::-1], axis=1), inverse.reshape(-1)
+
+    rows, inverse = numpy.unique(numpy.stack(columns, axis=1), axis=0, return_inverse=True)
+    return rows, inverse.reshape(-1)
+
+
+def _smooth_normals(positions: numpy.ndarray, triangles: numpy.ndarray) -> numpy.ndarray:
+    # area weighted average of the normals of the faces around each position
+    corners = positions[triangles]
+    face_normals = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    normals = numpy.zeros((len(positions), 3), dtype=numpy.float64)
+
+    for corner in range(3):
+        for axis in range(3):
+            normals[:, axis] += numpy.bincount(
+                triangles[:, corner], weights=face_normals[:, axis], minlength=len(positions),
+            )
+
+    lengths = numpy.linalg.norm(normals, axis=1, keepdims=True)
+    return (normals / numpy.where(lengths == 0.0, 1.0, lengths)).astype(numpy.float32)
+
+
+def fan_triangulate(face_sizes: numpy.ndarray) -> numpy.ndarray:
+    # face with corners c0..cn becomes (c0, c1, c2), (c0, c2, c3), ...
+    face_sizes = numpy.asarray(face_sizes, dtype=numpy.int64)
+    face_starts = numpy.cumsum(face_sizes) - face_sizes
+    triangles_amounts = numpy.maximum(face_sizes - 2, 0)
+
+    triangle_faces = numpy.repeat(numpy.arange(len(face_sizes)), triangles_amounts)
+    triangle_starts = numpy.cumsum(triangles_amounts) - triangles_amounts
+    places = numpy.arange(len(triangle_faces)) - triangle_starts[triangle_faces] + 1
+    firsts = face_starts[triangle_faces]
+
+    return numpy.stack([firsts, firsts + places, firsts + places + 1], axis=1)
+
+
+def _material_libraries(chunks: list[ParsedChunk], directory: Path) -> list[Path]:
+    return [directory / mtllib for chunk in chunks for mtllib in chunk.mtllibs]
+
+
+# returns the mesh and the material libraries it refers to, missing ones included
+def assemble(chunks: list[ParsedChunk], directory: Path) -> tuple[Mesh, list[Path]]:
+    positions_offsets = numpy.cumsum([0] + [len(chunk.positions) for chunk in chunks])
+    normals_offsets = numpy.cumsum([0] + [len(chunk.normals) for chunk in chunks])
+
+    positions = numpy.concatenate([chunk.positions for chunk in chunks])
+    normals = numpy.concatenate([chunk.normals for chunk in chunks])
+
+    corner_positions = numpy.concatenate([
+        chunk.corner_positions + chunk.corner_positions_relative * offset
+        for chunk, offset in zip(chunks, positions_offsets)
+    ])
+    corner_normals = numpy.concatenate([
+        chunk.corner_normals + chunk.corner_normals_relative * offset
+        for chunk, offset in zip(chunks, normals_offsets)
+    ])
+
+    libraries = _material_libraries(chunks, directory)
+
+    if not len(corner_positions):
+        return Mesh.empty(), libraries
+
+    if corner_positions.min() < 0 or corner_positions.max() >= len(positions):
+        raise ObjParseError('face refers to a missing vertex')
+
+    if corner_normals.max() >= len(normals) or (corner_normals < -1).any():
+        raise ObjParseError('face refers to a missing normal')
+
+    materials = {}
+    for mtllib_path in libraries:
+        if mtllib_path.exists():
+            parse_materials(mtllib_path.read_text(encoding='utf-8', errors='replace').splitlines(), materials)
+    parse_materials([line for chunk in chunks for line in chunk.material_lines], materials)
+
+    # a usemtl keeps working across chunk borders, so faces preceding the
+    # first usemtl of a chunk take the last material of the previous chunks
+    material_names = list(materials)
+    material_ids = {name: i for i, name in enumerate(material_names)}
+    missing_material = len(material_names)
+    face_materials = []
+    current_material = missing_material
+
+    for chunk in chunks:
+        names = numpy.array(
+            [material_ids.get(name, missing_material) for name in chunk.material_names] + [current_material],
+            dtype=numpy.int64,
+        )
+        face_materials.append(names[chunk.face_materials])
+        current_material = names[-2] if len(chunk.material_names) else current_material
+
+    face_sizes = numpy.concatenate([chunk.face_sizes for chunk in chunks])
+    corner_materials = numpy.repeat(numpy.concatenate(face_materials), face_sizes)
+    colors = numpy.array(
+        [materials[name] for name in material_names] + [(0.0, 0.0, 0.0)], dtype=numpy.float32,
+    )
+
+    triangles = fan_triangulate(face_sizes)
+    triangle_corners = triangles.reshape(-1)
+
+    corner_positions = corner_positions[triangle_corners]
+    corner_normals = corner_normals[triangle_corners]
+    corner_materials = corner_materials[triangle_corners]
+
+    # positions used without an explicit normal get a smooth one
+    if (corner_normals == -1).any():
+        smooth_normals = _smooth_normals(positions, corner_positions.reshape(-1, 3))
+        normals = numpy.concatenate([normals, smooth_normals])
+        corner_normals = numpy.where(corner_normals == -1, len(normals) - len(positions) + corner_positions, corner_normals)
+
+    vertexes, indexes = _unique_rows([corner_positions, corner_normals, corner_materials])
+
+    mesh = Mesh(
+        positions=positions[vertexes[:, 0]],
+        normals=normals[vertexes[:, 1]],
+        colors=colors[vertexes[:, 2]],
+        specular=numpy.zeros(len(vertexes)),
+        indexes=indexes,
+    )
+    return mesh, libraries
+
+
+_SHARED_ARRAYS = (
+    'positions', 'normals', 'face_sizes',
+    'corner_positions', 'corner_positions_relative',
+    'corner_normals', 'corner_normals_relative',
+    'face_materials',
+)
+_SHARED_ALIGNMENT = 64
+
+
+def _parse_range(path: str, start: int, end: int) -> tuple[str, dict, ParsedChunk]:
+    # runs in a worker process: the arrays of the parsed range are handed back
+    # in one shared memory block, only their layout and the material records are pickled
+    data = b''.join(block for _, block in read_blocks(Path(path), max(end - start, 1), start, end))
+    chunk = parse_chunk(data)
+
+    layout = {}
+    size = 0
+
+    for name in _SHARED_ARRAYS:
+        array = getattr(chunk, name)
+        layout[name] = (size, array.dtype.str, array.shape)
+        size += (array.nbytes + _SHARED_ALIGNMENT - 1) // _SHARED_ALIGNMENT * _SHARED_ALIGNMENT
+
+    memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+
+    for name in _SHARED_ARRAYS:
+        offset, dtype, shape = layout[name]
+        numpy.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=offset)[...] = getattr(chunk, name)
+        setattr(chunk, name, None)
+
+    # the parent process owns the block from now on and unlinks it, the
+    # resource tracker of the worker must not clean it up when the worker exits
+    resource_tracker.unregister(memory._name, 'shared_memory')
+    memory.close()
+    return memory.name, layout, chunk
+
+
+def _attach_range(memory: shared_memory.SharedMemory, layout: dict, chunk: ParsedChunk) -> ParsedChunk:
+    for name, (offset, dtype, shape) in layout.items():
+        setattr(chunk, name, numpy.ndarray(shape, dtype=dtype, buffer=memory.buf, offset=offset))
+    return chunk
+
+
+def split_ranges(size: int, amount: int) -> list[tuple[int, int]]:
+    bounds = [size * i // amount for i in range(amount + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+
+# the file is split into byte ranges parsed by a process pool; ranges are cut
+# at line ends by the workers, and assemble() fixes up relative indexes and
+# the usemtl state across the range borders
+def load_parallel(path: Path, workers: int, min_range_size: int = 1 << 20) -> tuple[Mesh, list[Path]]:
+    size = path.stat().st_size
+    ranges_amount = max(1, min(workers * 4, size // min_range_size))
+    memories = []
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_parse_range, str(path), start, end)
+                for start, end in split_ranges(size, ranges_amount)
+            ]
+            results = []
+            error = None
+
+            # every range is collected, so the memory of the parsed ones is freed on errors too
+            for future in futures:
+                try:
+                    name, layout, chunk = future.result()
+                except Exception as exception:
+                    error = error or exception
+                    continue
+
+                memories.append(shared_memory.SharedMemory(name=name))
+                results.append((layout, chunk))
+
+            if error is not None:
+                raise error
+
+        chunks = [_attach_range(memory, *result) for memory, result in zip(memories, results)]
+        assembled = assemble(chunks, path.parent)
+
+        # views into the shared memory have to be gone before it's closed
+        del chunks, results
+        return assembled
+    finally:
+        for memory in memories:
+            memory.close()
+            memory.unlink()
@@ -0,0 +1,29 @@
+from typing import Callable
+
+
+# every public attribute assignment bumps the version and notifies the
+# subscribers, so viewers can redraw only when something changed;
+# in-place changes (e.g. `obj.position.x = 1.0`) are not tracked
+class Observable:
+    def __setattr__(self, name: str, value) -> None:
+        super().__setattr__(name, value)
+
+        if not name.startswith('_'):
+            self._bump_version()
+
+    @property
+    def version(self) -> int:
+        return self.__dict__.get('_version', 0)
+
+    def on_change(self, subscriber: Callable[['Observable'], None]) -> None:
+        subscribers = self.__dict__.setdefault('_on_change_subscribers', [])
+        if subscriber not in subscribers:
+            subscribers.append(subscriber)
+
+    def _bump_version(self) -> None:
+        self.__dict__['_version'] = self.version + 1
+        self.__notify_about_changes()
+
+    def __notify_about_changes(self) -> None:
+        for subscriber in list(self.__dict__.get('_on_change_subscribers', ())):
+            subscriber(self)
@@ -0,0 +1,61 @@
+import struct
+import zlib
+from pathlib import Path
+from typing import Iterable
+
+import numpy
+
+
+_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# PNG color types by the amount of components
+_COLOR_TYPES = {3: 2, 4: 6}
+# rows are filtered and compressed this many bytes at a time, so images
+# of any size are written with bounded memory
+_BLOCK_SIZE = 1 << 22
+
+
+def _chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(data, zlib.crc32(kind)))
+
+
+def block_rows(width: int, components: int) -> int:
+    return max(1, _BLOCK_SIZE // (width * components))
+
+
+# (rows, width, 3 or 4) uint8 blocks of pixels, rows top-down; `order` picks
+# the components to store, e.g. (2, 1, 0, 3) for BGRA pixels
+def write_blocks(
+    path: Path,
+    width: int,
+    height: int,
+    components: int,
+    blocks: Iterable[numpy.ndarray],
+    compression: int = 6,
+    order: tuple[int, ...] | None = None,
+) -> None:
+    header = struct.pack('>IIBBBBB', width, height, 8, _COLOR_TYPES[components], 0, 0, 0)
+    compressor = zlib.compressobj(compression)
+
+    with path.open('wb') as file:
+        file.write(_SIGNATURE + _chunk(b'IHDR', header))
+
+        for block in blocks:
+            if order is not None:
+                block = block[..., list(order)]
+
+            # every row starts with its filter type, 0 stores the row as is
+            rows = numpy.zeros((len(block), width * components + 1), dtype=numpy.uint8)
+            rows[:, 1:] = block.reshape(len(block), -1)
+
+            data = compressor.compress(rows.data)
+            if data:
+                file.write(_chunk(b'IDAT', data))
+
+        file.write(_chunk(b'IDAT', compressor.flush()) + _chunk(b'IEND', b''))
+
+
+def write(path: Path, pixels: numpy.ndarray, compression: int = 6, order: tuple[int, ...] | None = None) -> None:
+    height, width, components = pixels.shape
+    step = block_rows(width, components)
+    blocks = (pixels[start:start + step] for start in range(0, height, step))
+    write_blocks(path, width, height, components, blocks, compression, order)
@@ -0,0 +1,60 @@
+import numpy
+
+
+# the render shader projects a world point as (x / z, -y / z, z / 100) with w = 1,
+# so the visible volume is |x| * scale_x <= |z|, |y| * scale_y <= |z|, |z| <= 100
+# (points behind the camera are mirrored, not clipped)
+DEPTH_RANGE = 100.0
+# (left, right, bottom, top) of the drawn part of the view in normalized coordinates
+FULL_VIEW = (-1.0, 1.0, -1.0, 1.0)
+# picks the coordinates of the 8 box corners from stacked (minimum, maximum) rows
+_CORNER_SELECTORS = numpy.indices((2, 2, 2)).reshape(3, -1).T
+
+
+def view_scale(view_size: tuple[float, float]) -> tuple[float, float]:
+    # mirrors the viewSize fit of the render vertex shader
+    if view_size[1] < 1.0:
+        return view_size[1], 1.0
+    return 1.0, 1.0 / view_size[1]
+
+
+def box_corners(minimum: numpy.ndarray, maximum: numpy.ndarray) -> numpy.ndarray:
+    # (N, 3) boxes to (N, 8, 3) corners
+    return numpy.stack([minimum, maximum], axis=1)[:, _CORNER_SELECTORS, [0, 1, 2]]
+
+
+# mask of the world space boxes that may reach the screen, or the window of it
+# that is drawn; the projection of the box corners bounds the projection of
+# everything inside as long as the box does not cross the z = 0 plane, such
+# boxes are always kept
+def visible_boxes(
+    minimum: numpy.ndarray,
+    maximum: numpy.ndarray,
+    scale: tuple[float, float],
+    window: tuple[float, float, float, float] = FULL_VIEW,
+) -> numpy.ndarray:
+    crossing = (minimum[:, 2] <= 0.0) & (maximum[:, 2] >= 0.0)
+    empty = (minimum > maximum).any(axis=1)
+    corners = box_corners(minimum, maximum)
+    z = numpy.where(crossing[:, None], 1.0, corners[..., 2])
+
+    with numpy.errstate(invalid='ignore'):
+        x = corners[..., 0] / z * scale[0]
+        y = -corners[..., 1] / z * scale[1]
+
+    left, right, bottom, top = window
+    outside = (
+        (x.min(axis=1) > right) | (x.max(axis=1) < left)
+        | (y.min(axis=1) > top) | (y.max(axis=1) < bottom)
+        | (minimum[:, 2] > DEPTH_RANGE) | (maximum[:, 2] < -DEPTH_RANGE)
+    )
+    return (crossing | ~outside) & ~empty
+
+
+# direction of the camera ray through a canvas pixel, the camera sits at the origin;
+# canvas rows go top-down like the rows of the rendered frame
+def screen_ray(point: tuple[int, int], canvas_size: tuple[int, int], view_size: tuple[float, float]) -> numpy.ndarray:
+    scale = view_scale(view_size)
+    x = 2.0 * (point[0] + 0.5) / canvas_size[0] - 1.0
+    y = 2.0 * (point[1] + 0.5) / canvas_size[1] - 1.0
+    return numpy.array([x / scale[0], -y / scale[1], 1.0])
@@ -1,12 +1,16 @@
+import ctypes
+import weakref
+from collections import deque
 from dataclasses import dataclass
 from enum import Enum
-from typing import Iterable
 
 import moderngl
 from OpenGL import GL
 import numpy
 
-from . import types, _light, _common
+from . import types, _light, _common, _culling, _projection, scene, model, lod
+from ._observable import Observable
+from .mesh import Mesh, Bounds
 
 class RenderMode(Enum):
     WIREFRAME = 1
@@ -18,18 +22,289 @@ class ProjectionType(Enum):
     PERSPECTIVE = 2
 
 
+class FaceCulling(Enum):
+    NONE = 1
+    BACK = 2
+    FRONT = 3
+
+
+# byte order of the pixels handed back by the renderer
+class PixelFormat(Enum):
+    RGB = 1
+    RGBA = 2
+    BGRA = 3
+
+    @property
+    def components(self) -> int:
+        return 3 if self == PixelFormat.RGB else 4
+
+
+# winding of the front faces as seen from outside of a model in world space
+class Winding(Enum):
+    CLOCKWISE = 1
+    COUNTERCLOCKWISE = 2
+
+
 @dataclass
 class CanvasSize:
     width: int
     height: int
         
 
+# pixel rectangle of a larger image, rows are counted like the rows of rendered
+# frames; parts of a tile outside of the image are drawn but hold nothing
+@dataclass
+class Tile:
+    image_size: CanvasSize
+    x: int
+    y: int
+    width: int
+    height: int
+
+    # (left, right, bottom, top) of the tile in normalized view coordinates
+    @property
+    def window(self) -> tuple[float, float, float, float]:
+        width, height = self.image_size.width, self.image_size.height
+        return (
+            2.0 * self.x / width - 1.0,
+            2.0 * (self.x + self.width) / width - 1.0,
+            2.0 * self.y / height - 1.0,
+            2.0 * (self.y + self.height) / height - 1.0,
+        )
+
+
+# the only row alignments GL_PACK_ALIGNMENT accepts
+_ROW_ALIGNMENTS = (1, 2, 4, 8)
+
+
+# assignments notify the on_change subscribers, e.g. to redraw a viewer
 @dataclass
-class Config:
+class Config(Observable):
     d: float
     view_size: tuple[float, float]
     mode: RenderMode
     projection: ProjectionType
+    frustum_culling: bool = True
+    face_culling: FaceCulling = FaceCulling.NONE
+    front_face: Winding = Winding.CLOCKWISE
+    # drops culled faces on the CPU before the draw, per object and cached while it
+    # does not move; objects drawn this way are no longer instanced
+    face_precull: bool = False
+    # pixel buffers frames are read into by render_async: with 2 or 3 a frame is
+    # handed back one or two frames later, once the GPU is done with it
+    readback_buffers: int = 1
+    pixel_format: PixelFormat = PixelFormat.RGB
+    # every row of the returned pixels starts at a multiple of this many bytes
+    row_alignment: int = 1
+
+    def __setattr__(self, name: str, value) -> None:
+        if name == 'row_alignment' and value not in _ROW_ALIGNMENTS:
+            raise ValueError(f'Row alignment must be one of {_ROW_ALIGNMENTS}, got {value}')
+        super().__setattr__(name, value)
+
+
+@dataclass
+class FrameStatistics:
+    objects_amount: int = 0
+    culled_amount: int = 0
+    draw_calls: int = 0
+    precull_triangles: int = 0
+    triangles_amount: int = 0
+
+
+_VERTEX_FORMAT = '3f 3f 3f 1f'
+_VERTEX_ATTRIBUTES = ('in_vert', 'in_normal', 'in_color', 'in_specular')
+_VERTEX_SIZE = 10
+
+
+def _pack_mesh(mesh: Mesh) -> numpy.ndarray:
+    vertexes = numpy.empty((len(mesh.positions), _VERTEX_SIZE), dtype=numpy.float32)
+    vertexes[:, 0:3] = mesh.positions
+    vertexes[:, 3:6] = mesh.normals
+    vertexes[:, 6:9] = mesh.colors
+    vertexes[:, 9] = mesh.specular
+    return vertexes
+
+
+_FRAME_ALIGNMENT = 64
+
+
+_INSTANCE_FORMAT = '16f 9f 4f 1f/i'
+_INSTANCE_ATTRIBUTES = ('in_model', 'in_normal_matrix', 'in_instance_color', 'in_instance_specular')
+
+
+@dataclass
+class _MeshBuffers:
+    # vertex array content: (buffer, format, *attributes) tuples
+    vertex_buffers: list[tuple]
+    index_buffer: moderngl.Buffer
+    indexes_amount: int
+
+    def release(self) -> None:
+        for buffer, *_ in self.vertex_buffers:
+            buffer.release()
+        self.index_buffer.release()
+
+
+# GPU side of model.stream: buffers are preallocated for the whole model and
+# filled with offset writes, so only the chunk being uploaded is kept on the host;
+# the triangles uploaded so far are drawn while loading continues
+class StreamingMesh:
+    _ROW_SIZES = {'positions': 12, 'normals': 12, 'colors': 12, 'indexes': 4}
+
+    def __init__(self, stream: model.MeshStream) -> None:
+        context = _common.create_context()
+        vertexes_size = max(stream.vertexes_amount, 1) * 12
+
+        self._chunks = iter(stream)
+        self._buffers = {
+            'positions': context.buffer(reserve=vertexes_size),
+            'normals': context.buffer(reserve=vertexes_size),
+            'colors': context.buffer(reserve=vertexes_size),
+            'indexes': context.buffer(reserve=max(stream.triangles_amount, 1) * 3 * 4),
+        }
+        # normals arrive last, lighting reads zero normals until then
+        self._buffers['normals'].clear()
+
+        self.buffers = _MeshBuffers(
+            vertex_buffers=[
+                (self._buffers['positions'], '3f', 'in_vert'),
+                (self._buffers['normals'], '3f', 'in_normal'),
+                (self._buffers['colors'], '3f', 'in_color'),
+            ],
+            index_buffer=self._buffers['indexes'],
+            indexes_amount=0,
+        )
+        self.progress = 0.0
+        self.done = False
+        self._bounds: Bounds | None = None
+
+    def upload(self, chunk: model.MeshChunk) -> None:
+        dtype = numpy.uint32 if chunk.attribute == 'indexes' else numpy.float32
+        data = numpy.ascontiguousarray(chunk.data, dtype=dtype)
+        self._buffers[chunk.attribute].write(data, offset=chunk.offset * self._ROW_SIZES[chunk.attribute])
+
+        if chunk.attribute == 'indexes':
+            self.buffers.indexes_amount = max(self.buffers.indexes_amount, chunk.offset + len(data))
+        elif chunk.attribute == 'positions' and len(data):
+            self._extend_bounds(data.reshape(-1, 3))
+        self.progress = chunk.progress
+
+    def _extend_bounds(self, positions: numpy.ndarray) -> None:
+        minimum, maximum = positions.min(axis=0).astype(numpy.float64), positions.max(axis=0).astype(numpy.float64)
+
+        if self._bounds is not None:
+            minimum, maximum = numpy.minimum(minimum, self._bounds.minimum), numpy.maximum(maximum, self._bounds.maximum)
+        self._bounds = Bounds.from_box(minimum, maximum)
+
+    # bounds of the positions uploaded so far, indexes only refer to uploaded vertexes;
+    # a new object is returned once they grow
+    @property
+    def bounds(self) -> Bounds | None:
+        return self._bounds
+
+    # uploads up to `chunks_amount` chunks, returns False once the model is loaded
+    def load(self, chunks_amount: int = 1) -> bool:
+        for _ in range(chunks_amount):
+            chunk = next(self._chunks, None)
+
+            if chunk is None:
+                self.done = True
+                self.progress = 1.0
+                return False
+
+            self.upload(chunk)
+
+        return True
+
+    def __len__(self) -> int:
+        return self.buffers.indexes_amount // 3
+
+    def release(self) -> None:
+        self.buffers.release()
+
+
+# instance buffer and vertex array of one mesh; the buffer grows to the
+# largest amount of instances drawn so far and is rewritten every frame
+class _InstancedDraw:
+    def __init__(self, context: moderngl.Context, shader: moderngl.Program, buffers: _MeshBuffers) -> None:
+        self._context = context
+        self._shader = shader
+        self._buffers = buffers
+        self._capacity = 0
+        self._instance_buffer: moderngl.Buffer | None = None
+        self._vertex_array: moderngl.VertexArray | None = None
+
+    def _reserve(self, instances_amount: int) -> None:
+        if instances_amount <= self._capacity:
+            return
+
+        self.release()
+        self._capacity = max(instances_amount, 2 * self._capacity)
+        self._instance_buffer = self._context.buffer(reserve=self._capacity * scene.INSTANCE_SIZE * 4)
+        self._vertex_array = self._context.vertex_array(
+            self._shader,
+            [*self._buffers.vertex_buffers, (self._instance_buffer, _INSTANCE_FORMAT, *_INSTANCE_ATTRIBUTES)],
+            index_buffer=self._buffers.index_buffer,
+            index_element_size=4,
+        )
+
+    def render(self, instances: numpy.ndarray) -> None:
+        self._reserve(len(instances))
+        self._instance_buffer.write(numpy.ascontiguousarray(instances, dtype=numpy.float32))
+        self._vertex_array.render(
+            moderngl.TRIANGLES,
+            vertices=self._buffers.indexes_amount,
+            instances=len(instances),
+        )
+
+    def release(self) -> None:
+        if self._vertex_array is not None:
+            self._vertex_array.release()
+            self._instance_buffer.release()
+            self._vertex_array = None
+            self._instance_buffer = None
+
+
+@dataclass
+class _PrecullDraw:
+    draw: _InstancedDraw
+    index_buffer: moderngl.Buffer
+    culled_amount: int
+    mode: tuple
+
+    def release(self) -> None:
+        self.draw.release()
+        if self.index_buffer is not None:
+            self.index_buffer.release()
+            self.index_buffer = None
+
+
+@dataclass
+class Frame:
+    frame_id: int
+    size: CanvasSize
+    pixels: numpy.ndarray
+
+
+@dataclass
+class _PendingFrame:
+    frame_id: int
+    size: CanvasSize
+    buffer: moderngl.Buffer
+
+
+@dataclass
+class _FrameResources:
+    size: CanvasSize
+    color_attachment: moderngl.Texture
+    depth_attachment: moderngl.Renderbuffer
+    frame_buffer: moderngl.Framebuffer
+
+    def release(self) -> None:
+        self.frame_buffer.release()
+        self.depth_attachment.release()
+        self.color_attachment.release()
 
 
 class Renderer:
@@ -37,41 +312,387 @@ class Renderer:
         self._config = config
         self._context = _common.create_context()
         self._shader = self._context.program(**_common.load_shader('render'))
+        self._mesh_buffers = weakref.WeakKeyDictionary()
+        self._instanced_draws = weakref.WeakKeyDictionary()
+        self._precull_draws = weakref.WeakKeyDictionary()
+        # level of detail each scene object was drawn with in the last frames
+        self._lod_levels = weakref.WeakKeyDictionary()
+        self._frame_resources: _FrameResources | None = None
+        self._written_lights: tuple[_light.Light, ...] | None = None
+        # frames read into pixel buffers by render_async, oldest first
+        self._pending_frames: deque[_PendingFrame] = deque()
+        # frames completed early after `readback_buffers` was lowered, handed back
+        # one per render_async call so no submitted frame is lost
+        self._ready_frames: deque[Frame] = deque()
+        self._free_readback_buffers: list[moderngl.Buffer] = []
+        self._frames_amount = 0
+        self.statistics = FrameStatistics()
+
+    # render targets live until the canvas size changes
+    def _get_frame_resources(self, canvas_size: CanvasSize) -> _FrameResources:
+        if self._frame_resources is not None and self._frame_resources.size == canvas_size:
+            return self._frame_resources
 
-    def render(
-        self,
-        canvas_size: CanvasSize,
-        vertexes: numpy.ndarray,
-        lights: Iterable[_light.Light],
-    ) -> numpy.ndarray:
         _cnv = (canvas_size.width, canvas_size.height)
+        color_attachment = self._context.texture(_cnv, 4)
+        depth_attachment = self._context.depth_renderbuffer(_cnv)
 
-        frame_buffer = self._context.framebuffer(
-            color_attachments=self._context.texture(_cnv, 4),
-            depth_attachment=self._context.depth_renderbuffer(_cnv),
+        resources = _FrameResources(
+            size=CanvasSize(canvas_size.width, canvas_size.height),
+            color_attachment=color_attachment,
+            depth_attachment=depth_attachment,
+            frame_buffer=self._context.framebuffer(
+                color_attachments=color_attachment,
+                depth_attachment=depth_attachment,
+            ),
         )
 
-        vertex_buffer = self._context.buffer(vertexes)
-        template_buffer = self._context.buffer(reserve=vertex_buffer.size)
+        # the old framebuffer may still be bound, it is only deleted once
+        # the new one took its place
+        resources.frame_buffer.use()
+        self._release_frame_resources()
+        self._frame_resources = resources
+
+        return self._frame_resources
+
+    # light uniforms are only rewritten when dump_scene hands over another light list
+    def _write_lights(self, lights: tuple[_light.Light, ...]) -> None:
+        if lights is self._written_lights:
+            return
+
+        packed = _light.pack(lights)
+        self._shader['lightsAmount'] = packed.amount
+        self._shader['lightTypes'].write(packed.types)
+        self._shader['lightIntensities'].write(packed.intensities)
+        self._shader['lightVectors'].write(packed.vectors)
+        self._written_lights = lights
 
-        for light in lights:
-            light.transform(vertex_buffer, template_buffer)
-            vertex_buffer, template_buffer = template_buffer, vertex_buffer
+    def _release_frame_resources(self) -> None:
+        if self._frame_resources is not None:
+            self._frame_resources.release()
+            self._frame_resources = None
+
+    def release(self) -> None:
+        self._release_frame_resources()
+
+        for buffer in [*self._free_readback_buffers, *(frame.buffer for frame in self._pending_frames)]:
+            buffer.release()
+        self._free_readback_buffers.clear()
+        self._pending_frames.clear()
+        self._ready_frames.clear()
+
+        for draws in (self._instanced_draws, self._precull_draws):
+            for draw in draws.values():
+                draw.release()
+            draws.clear()
+
+        for buffers in self._mesh_buffers.values():
+            buffers.release()
+        self._mesh_buffers.clear()
+
+    # meshes are uploaded once and stay on the GPU while the mesh object is alive,
+    # so they must not be modified in place after the first render
+    def _get_mesh_buffers(self, mesh: Mesh) -> _MeshBuffers:
+        buffers = self._mesh_buffers.get(mesh)
+
+        if buffers is None:
+            buffers = _MeshBuffers(
+                vertex_buffers=[(self._context.buffer(_pack_mesh(mesh)), _VERTEX_FORMAT, *_VERTEX_ATTRIBUTES)],
+                index_buffer=self._context.buffer(mesh.indexes),
+                indexes_amount=len(mesh.indexes),
+            )
+            self._mesh_buffers[mesh] = buffers
+            weakref.finalize(mesh, buffers.release)
+
+        return buffers
+
+    def _get_instanced_draw(self, mesh: Mesh | StreamingMesh) -> _InstancedDraw:
+        draw = self._instanced_draws.get(mesh)
+
+        if draw is None:
+            buffers = mesh.buffers if isinstance(mesh, StreamingMesh) else self._get_mesh_buffers(mesh)
+            draw = _InstancedDraw(self._context, self._shader, buffers)
+            self._instanced_draws[mesh] = draw
+            weakref.finalize(mesh, draw.release)
+
+        return draw
+
+    # draw of one object with only the triangles that survive face culling,
+    # the index buffer is kept until the object or the culling config changes
+    def _get_precull_draw(self, dumped_object: scene.DumpedObject, mesh: Mesh) -> '_PrecullDraw':
+        mode = (self._config.face_culling, self._config.front_face, mesh)
+        cached = self._precull_draws.get(dumped_object)
+
+        if cached is not None:
+            if cached.mode == mode:
+                return cached
+            cached.release()
+
+        indexes = _culling.facing_triangles(
+            mesh, dumped_object.model,
+            clockwise=self._config.front_face == Winding.CLOCKWISE,
+            front=self._config.face_culling == FaceCulling.BACK,
+        )
+        mesh_buffers = self._get_mesh_buffers(mesh)
+        index_buffer = self._context.buffer(indexes) if len(indexes) else self._context.buffer(reserve=4)
+
+        draw = _InstancedDraw(self._context, self._shader, _MeshBuffers(
+            vertex_buffers=mesh_buffers.vertex_buffers,
+            index_buffer=index_buffer,
+            indexes_amount=len(indexes),
+        ))
+        cached = _PrecullDraw(draw, index_buffer, (len(mesh.indexes) - len(indexes)) // 3, mode)
+        self._precull_draws[dumped_object] = cached
+        weakref.finalize(dumped_object, cached.release)
+
+        return cached
+
+    # splits the objects drawn with LOD chains by the level picked for them
+    def _select_levels(
+        self,
+        meshes: tuple[scene.DumpedMesh, ...],
+        canvas_size: CanvasSize,
+    ) -> tuple[scene.DumpedMesh, ...]:
+        result = []
+
+        for dumped_mesh in meshes:
+            chain = dumped_mesh.mesh
+            if not isinstance(chain, lod.LodChain):
+                result.append(dumped_mesh)
+                continue
+
+            models = _culling.model_matrices(dumped_mesh.instances)
+            bounds = chain.bounds
+            centers = models[:, :3, :3] @ bounds.center + models[:, :3, 3]
+            radiuses = bounds.radius * numpy.linalg.norm(models[:, :3, :3], axis=1).max(axis=1)
+
+            sizes = lod.screen_sizes(centers, radiuses, (canvas_size.width, canvas_size.height), self._config.view_size)
+            previous = numpy.array([self._lod_levels.get(obj.source, -1) for obj in dumped_mesh.objects])
+            levels = chain.select(sizes, previous)
+
+            for obj, level in zip(dumped_mesh.objects, levels.tolist()):
+                self._lod_levels[obj.source] = level
+
+            for level in numpy.unique(levels).tolist():
+                selected = levels == level
+                result.append(scene.DumpedMesh(
+                    chain.levels[level].mesh,
+                    tuple(obj for obj, keep in zip(dumped_mesh.objects, selected) if keep),
+                    dumped_mesh.instances[selected],
+                ))
+
+        return tuple(result)
+
+    def _apply_face_culling(self) -> None:
+        if self._config.face_culling == FaceCulling.NONE:
+            self._context.disable(moderngl.CULL_FACE)
+            return
+
+        self._context.cull_face = 'back' if self._config.face_culling == FaceCulling.BACK else 'front'
+        self._context.enable(moderngl.CULL_FACE)
+
+    def _set_front_face(self, mirrored: bool) -> None:
+        # the camera looks along +z and the shader mirrors y (-y / z): the two
+        # reflections cancel out, faces keep their winding on screen unless
+        # the model matrix mirrors them
+        clockwise = (self._config.front_face == Winding.CLOCKWISE) != mirrored
+        self._context.front_face = 'cw' if clockwise else 'ccw'
+
+    def _draw(
+        self,
+        canvas_size: CanvasSize,
+        meshes: tuple[scene.DumpedMesh, ...],
+        lights: tuple[_light.Light, ...],
+        tile: Tile | None = None,
+    ) -> moderngl.Framebuffer:
+        frame_buffer = self._get_frame_resources(canvas_size).frame_buffer
 
         frame_buffer.use()
         frame_buffer.clear(1.0, 1.0, 1.0, 1.0)
 
+        # levels of detail are picked for the size of the whole image
+        window = tile.window if tile is not None else _projection.FULL_VIEW
+        image_size = tile.image_size if tile is not None else canvas_size
+        left, right, bottom, top = window
+
         self._shader['viewSize'] = self._config.view_size
-        vertex_array = self._context.simple_vertex_array(
-            self._shader, vertex_buffer,
-            'in_vert', 'in_normal', 'in_color', 'in_intensity', 'in_specular',
-        )
+        self._shader['viewWindow'] = ((left + right) / 2, (bottom + top) / 2, (right - left) / 2, (top - bottom) / 2)
+        self._write_lights(lights)
 
         if self._config.mode == RenderMode.WIREFRAME:
             self._context.wireframe = True
         GL.glEnable(GL.GL_DEPTH_TEST)
-        vertex_array.render(moderngl.TRIANGLES)
+        self._apply_face_culling()
+
+        statistics = FrameStatistics(objects_amount=sum(len(dumped_mesh.objects) for dumped_mesh in meshes))
+
+        # frames cull the instance arrays of the draw calls directly, in one vectorized
+        # pass per mesh with the shader offsets and the tile window accounted for;
+        # the scene hierarchy serves the per-object queries (picking, nearest)
+        if self._config.frustum_culling:
+            meshes, statistics.culled_amount = _culling.cull(meshes, self._config.view_size, window)
+
+        meshes = self._select_levels(meshes, image_size)
+        statistics.triangles_amount = sum(len(dumped_mesh.mesh) * len(dumped_mesh.instances) for dumped_mesh in meshes)
+
+        precull = self._config.face_precull and self._config.face_culling != FaceCulling.NONE
+
+        # one draw call per unique mesh, however many objects share it; with face
+        # culling mirrored objects are drawn separately with the opposite front face
+        for dumped_mesh in meshes:
+            if self._config.face_culling == FaceCulling.NONE:
+                self._get_instanced_draw(dumped_mesh.mesh).render(dumped_mesh.instances)
+                statistics.draw_calls += 1
+                continue
+
+            mirrored = _culling.mirrored_instances(dumped_mesh.instances)
+
+            if precull and isinstance(dumped_mesh.mesh, Mesh):
+                for dumped_object, instance, flipped in zip(dumped_mesh.objects, dumped_mesh.instances, mirrored):
+                    precull_draw = self._get_precull_draw(dumped_object, dumped_mesh.mesh)
+                    self._set_front_face(flipped)
+                    precull_draw.draw.render(instance[None])
+                    statistics.precull_triangles += precull_draw.culled_amount
+                    statistics.draw_calls += 1
+                continue
+
+            for flipped in (False, True):
+                instances = dumped_mesh.instances[mirrored == flipped]
+
+                if len(instances):
+                    self._set_front_face(flipped)
+                    self._get_instanced_draw(dumped_mesh.mesh).render(instances)
+                    statistics.draw_calls += 1
+
+        self.statistics = statistics
+
         if self._config.mode == RenderMode.WIREFRAME:
             self._context.wireframe = False
 
-        return numpy.frombuffer(frame_buffer.read(), dtype=numpy.uint8)
+        self._frames_amount += 1
+        return frame_buffer
+
+    # bytes between the starts of two rows of pixels in the configured format
+    def row_stride(self, canvas_size: CanvasSize) -> int:
+        alignment = self._config.row_alignment
+        return -(-canvas_size.width * self._config.pixel_format.components // alignment) * alignment
+
+    def frame_bytes(self, canvas_size: CanvasSize) -> int:
+        return self.row_stride(canvas_size) * canvas_size.height
+
+    def _read_into(self, frame_buffer: moderngl.Framebuffer, canvas_size: CanvasSize, target) -> None:
+        pixel_format, alignment = self._config.pixel_format, self._config.row_alignment
+
+        if pixel_format != PixelFormat.BGRA:
+            frame_buffer.read_into(target, components=pixel_format.components, alignment=alignment)
+            return
+
+        # moderngl only reads RGB(A), BGRA goes straight through glReadPixels
+        frame_buffer.use()
+        GL.glPixelStorei(GL.GL_PACK_ALIGNMENT, alignment)
+
+        if isinstance(target, moderngl.Buffer):
+            GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, target.glo)
+            GL.glReadPixels(0, 0, canvas_size.width, canvas_size.height, GL.GL_BGRA, GL.GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+            GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+        else:
+            GL.glReadPixels(0, 0, canvas_size.width, canvas_size.height, GL.GL_BGRA, GL.GL_UNSIGNED_BYTE, target)
+
+    def render(
+        self,
+        canvas_size: CanvasSize,
+        meshes: tuple[scene.DumpedMesh, ...],
+        lights: tuple[_light.Light, ...],
+    ) -> numpy.ndarray:
+        return self.render_into(canvas_size, meshes, lights, numpy.empty(self.frame_bytes(canvas_size), dtype=numpy.uint8))
+
+    # reusable output for render_into: (height, row_stride) bytes starting at an
+    # address aligned for SIMD loads and QImage scanlines
+    def allocate_frame(self, canvas_size: CanvasSize) -> numpy.ndarray:
+        size = self.frame_bytes(canvas_size)
+        raw = numpy.empty(size + _FRAME_ALIGNMENT, dtype=numpy.uint8)
+        offset = -raw.ctypes.data % _FRAME_ALIGNMENT
+        return raw[offset:offset + size].reshape(canvas_size.height, self.row_stride(canvas_size))
+
+    # reads the frame into a caller-owned C-contiguous uint8 array holding at
+    # least frame_bytes(), in the configured pixel format and row alignment
+    def render_into(
+        self,
+        canvas_size: CanvasSize,
+        meshes: tuple[scene.DumpedMesh, ...],
+        lights: tuple[_light.Light, ...],
+        out: numpy.ndarray,
+    ) -> numpy.ndarray:
+        if out.dtype != numpy.uint8 or not out.flags.c_contiguous or out.nbytes < self.frame_bytes(canvas_size):
+            raise ValueError('Output array must be a contiguous uint8 array of at least one frame')
+
+        frame_buffer = self._draw(canvas_size, meshes, lights)
+        self._read_into(frame_buffer, canvas_size, out)
+        return out
+
+    # renders one tile of a larger image into `out`, laid out like a frame of the
+    # tile size; the GPU and host memory used depend on the tile size only
+    def render_tile_into(
+        self,
+        tile: Tile,
+        meshes: tuple[scene.DumpedMesh, ...],
+        lights: tuple[_light.Light, ...],
+        out: numpy.ndarray,
+    ) -> numpy.ndarray:
+        canvas_size = CanvasSize(tile.width, tile.height)
+        if out.dtype != numpy.uint8 or not out.flags.c_contiguous or out.nbytes < self.frame_bytes(canvas_size):
+            raise ValueError('Output array must be a contiguous uint8 array of at least one frame')
+
+        frame_buffer = self._draw(canvas_size, meshes, lights, tile)
+        self._read_into(frame_buffer, canvas_size, out)
+        return out
+
+    def _get_readback_buffer(self, size: int) -> moderngl.Buffer:
+        buffer = self._free_readback_buffers.pop() if self._free_readback_buffers else None
+
+        if buffer is not None and buffer.size != size:
+            buffer.release()
+            buffer = None
+
+        return buffer if buffer is not None else self._context.buffer(reserve=size, dynamic=True)
+
+    def _complete(self, pending: _PendingFrame) -> Frame:
+        pixels = numpy.frombuffer(pending.buffer.read(), dtype=numpy.uint8)
+        self._free_readback_buffers.append(pending.buffer)
+        return Frame(pending.frame_id, pending.size, pixels)
+
+    # draws a frame and starts reading it into a pixel buffer without waiting
+    # for the GPU; returns the oldest frame that has to be completed to keep
+    # at most `readback_buffers` frames in flight, None while the pipeline fills up;
+    # when `readback_buffers` was lowered, the frames over it are completed at once
+    # and their pixel buffers freed, the frames still come back in order
+    def render_async(
+        self,
+        canvas_size: CanvasSize,
+        meshes: tuple[scene.DumpedMesh, ...],
+        lights: tuple[_light.Light, ...],
+    ) -> Frame | None:
+        frame_buffer = self._draw(canvas_size, meshes, lights)
+        buffer = self._get_readback_buffer(self.frame_bytes(canvas_size))
+        self._read_into(frame_buffer, canvas_size, buffer)
+
+        size = CanvasSize(canvas_size.width, canvas_size.height)
+        self._pending_frames.append(_PendingFrame(self._frames_amount, size, buffer))
+
+        depth = max(self._config.readback_buffers, 1)
+        while len(self._pending_frames) >= depth:
+            self._ready_frames.append(self._complete(self._pending_frames.popleft()))
+
+        # pixel buffers beyond the depth are not needed anymore
+        while len(self._free_readback_buffers) > depth:
+            self._free_readback_buffers.pop().release()
+
+        return self._ready_frames.popleft() if self._ready_frames else None
+
+    # completes every frame still in flight, oldest first
+    def finish(self) -> list[Frame]:
+        frames = list(self._ready_frames)
+        self._ready_frames.clear()
+        while self._pending_frames:
+            frames.append(self._complete(self._pending_frames.popleft()))
+        return frames
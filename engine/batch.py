@@ -0,0 +1,375 @@
+import argparse
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy
+
+from . import engine, scene, types, model, geometry, _png
+
+
+# scene description, a JSON file:
+# {
+#     "canvas": {"width": 800, "height": 600},
+#     "camera": {"view_size": [1.0, 0.75], "mode": "fill", "projection": "perspective"},
+#     "meshes": {
+#         "body": {"obj": "models/body.obj"},
+#         "tube": {"procedural": "cylinder", "parameters": {"r": 1, "h": 2, "n": 64},
+#                  "color": [0, 255, 0], "specular": 500}
+#     },
+#     "objects": [{"name": "tube", "mesh": "tube", "position": [0, 0, 5],
+#                  "rotation": [0, 0, 0], "scale": [1, 1, 1], "color": [255, 0, 0]}],
+#     "lights": [{"type": "ambient", "intensity": 0.3},
+#                {"type": "point", "intensity": 0.5, "position": [1, 1, 0]},
+#                {"type": "directional", "intensity": 0.5, "direction": [0, 0, -1]}],
+#     "frames": {"count": 360, "step": {"tube": {"rotation": [0, 0.0174533, 0]}}}
+# }
+# frames are either a count with per-frame increments of object transforms, or
+# a list where every item sets the transforms of some objects for one frame;
+# the camera sits at the origin looking along +z, paths are relative to the file
+
+
+class SceneDescriptionError(Exception):
+    __tmp: str = "Can't read scene description: {reason}"
+
+    def __init__(self, reason: str) -> None:
+        self.reason = reason
+        super().__init__(self.__tmp.format(reason=reason))
+
+
+_RENDER_MODES = {'fill': engine.RenderMode.FILL, 'wireframe': engine.RenderMode.WIREFRAME}
+_PROJECTIONS = {'perspective': engine.ProjectionType.PERSPECTIVE, 'isometric': engine.ProjectionType.ISOMETRIC}
+_PIXEL_FORMATS = {'rgb': engine.PixelFormat.RGB, 'rgba': engine.PixelFormat.RGBA, 'bgra': engine.PixelFormat.BGRA}
+_GENERATORS = {
+    'cylinder': geometry.cylinder,
+    'cone': geometry.cone,
+    'sphere': geometry.sphere,
+    'torus': geometry.torus,
+    'prism': geometry.prism,
+}
+_LIGHTS = {'ambient': scene.AmbientLight, 'point': scene.PointLight, 'directional': scene.DirectionalLight}
+_TRANSFORMS = ('position', 'rotation', 'scale')
+
+
+@dataclass
+class Job:
+    description: dict
+    base_path: Path
+    output: Path
+    file_format: str = 'png'
+    pixel_format: engine.PixelFormat = engine.PixelFormat.RGB
+    name_pattern: str = 'frame_{index:05d}'
+    compression: int = 6
+    readback_buffers: int = 2
+    # renders every frame in square tiles of this many pixels into a memory-mapped
+    # raw image, so that the frame size is not bound by GL limits or memory
+    tile_size: int | None = None
+
+    @property
+    def canvas_size(self) -> engine.CanvasSize:
+        canvas = self.description['canvas']
+        return engine.CanvasSize(canvas['width'], canvas['height'])
+
+    def frame_path(self, index: int, suffix: str) -> Path:
+        return self.output / f'{self.name_pattern.format(index=index)}.{suffix}'
+
+    # components of the pixels written to PNG files
+    @property
+    def png_order(self) -> tuple[int, ...] | None:
+        return (2, 1, 0, 3) if self.pixel_format == engine.PixelFormat.BGRA else None
+
+
+def load_description(path: Path) -> dict:
+    try:
+        with path.open() as file:
+            description = json.load(file)
+    except (OSError, ValueError) as error:
+        raise SceneDescriptionError(str(error)) from error
+
+    for key in ('canvas', 'objects'):
+        if key not in description:
+            raise SceneDescriptionError(f'missing {key!r}')
+    return description
+
+
+def _vector(value) -> types.Vector3:
+    return types.Vector3(*map(float, value))
+
+
+def _color(value) -> types.Color:
+    return types.Color(*map(int, value))
+
+
+def _build_mesh(description: dict, base_path: Path):
+    if 'obj' in description:
+        return model.load(str(base_path / description['obj']))
+
+    generator = _GENERATORS.get(description.get('procedural'))
+    if generator is None:
+        raise SceneDescriptionError(f'unknown mesh {description!r}')
+
+    return generator(
+        **description.get('parameters', {}),
+        color=_color(description.get('color', (255, 255, 255))),
+        specular=float(description.get('specular', 0.0)),
+    )
+
+
+def build_scene(description: dict, base_path: Path) -> scene.Scene:
+    meshes = {name: _build_mesh(mesh, base_path) for name, mesh in description.get('meshes', {}).items()}
+    s = scene.Scene()
+
+    for obj in description['objects']:
+        if obj.get('mesh') not in meshes:
+            raise SceneDescriptionError(f'object {obj.get("name")!r} uses unknown mesh {obj.get("mesh")!r}')
+
+        s.add_object(scene.SceneObject(
+            name=obj['name'],
+            position=_vector(obj.get('position', (0, 0, 0))),
+            rotation=_vector(obj.get('rotation', (0, 0, 0))),
+            scale=_vector(obj.get('scale', (1, 1, 1))),
+            mesh=meshes[obj['mesh']],
+            color=_color(obj['color']) if 'color' in obj else None,
+            specular=obj.get('specular'),
+        ))
+
+    for i, light in enumerate(description.get('lights', ())):
+        light_type = _LIGHTS.get(light.get('type'))
+        if light_type is None:
+            raise SceneDescriptionError(f'unknown light type {light.get("type")!r}')
+
+        vectors = {key: _vector(light[key]) for key in ('position', 'direction') if key in light}
+        s.add_object(light_type(light.get('name', f'light-{i}'), float(light['intensity']), **vectors))
+
+    return s
+
+
+def frames_amount(description: dict) -> int:
+    frames = description.get('frames', {'count': 1})
+    return len(frames) if isinstance(frames, list) else int(frames['count'])
+
+
+# puts the objects into their state for one frame, computed from the initial
+# state alone so that workers can render frames in any order
+class _Animation:
+    def __init__(self, description: dict, s: scene.Scene) -> None:
+        self._frames = description.get('frames', {'count': 1})
+        self._objects = {obj['name']: s.get_by_name(obj['name']) for obj in description['objects']}
+        self._initial = {
+            name: {key: numpy.array(list(getattr(obj, key))) for key in _TRANSFORMS}
+            for name, obj in self._objects.items()
+        }
+
+    def apply(self, index: int) -> None:
+        if isinstance(self._frames, list):
+            changes = {name: {key: numpy.array(value) for key, value in state.items()}
+                       for name, state in self._frames[index].items()}
+        else:
+            changes = {name: {key: self._initial[name][key] + index * numpy.array(value) for key, value in step.items()}
+                       for name, step in self._frames.get('step', {}).items()}
+
+        for name, obj in self._objects.items():
+            for key in _TRANSFORMS:
+                value = changes.get(name, {}).get(key, self._initial[name][key])
+                setattr(obj, key, _vector(value))
+
+
+def _render_config(description: dict, job: Job) -> engine.Config:
+    canvas, camera = description['canvas'], description.get('camera', {})
+    return engine.Config(
+        d=1.0,
+        view_size=tuple(camera.get('view_size', (1.0, canvas['height'] / canvas['width']))),
+        mode=_RENDER_MODES[camera.get('mode', 'fill')],
+        projection=_PROJECTIONS[camera.get('projection', 'perspective')],
+        readback_buffers=job.readback_buffers,
+        pixel_format=job.pixel_format,
+    )
+
+
+class _Worker:
+    def __init__(self, job: Job) -> None:
+        self._job = job
+        self._engine = engine.Engine(_render_config(job.description, job))
+        self._scene = build_scene(job.description, job.base_path)
+        self._animation = _Animation(job.description, self._scene)
+        self._tile_frame: numpy.ndarray | None = None
+
+    def _pixels(self, data: numpy.ndarray, size: engine.CanvasSize) -> numpy.ndarray:
+        components = self._job.pixel_format.components
+        rows = data.reshape(size.height, -1)[:, :size.width * components]
+        return rows.reshape(size.height, size.width, components)
+
+    def _write(self, index: int, frame: engine.Frame) -> None:
+        job = self._job
+
+        if job.file_format == 'raw':
+            job.frame_path(index, 'raw').write_bytes(frame.pixels.data)
+            return
+
+        _png.write(job.frame_path(index, 'png'), self._pixels(frame.pixels, frame.size), job.compression, job.png_order)
+
+    # frames come back from the readback pipeline in the order they were submitted
+    def render(self, indexes: range) -> int:
+        submitted = deque()
+
+        for index in indexes:
+            self._animation.apply(index)
+            submitted.append(index)
+            frame = self._engine.render_async(self._job.canvas_size, self._scene)
+            if frame is not None:
+                self._write(submitted.popleft(), frame)
+
+        for frame in self._engine.finish():
+            self._write(submitted.popleft(), frame)
+
+        return len(indexes)
+
+    # renders tiles given by their corners into the raw image of a frame
+    def render_tiles(self, index: int, corners: list[tuple[int, int]]) -> int:
+        job, image_size = self._job, self._job.canvas_size
+        tile_size = engine.CanvasSize(min(job.tile_size, image_size.width), min(job.tile_size, image_size.height))
+
+        if self._tile_frame is None:
+            self._tile_frame = self._engine.allocate_frame(tile_size)
+
+        components = job.pixel_format.components
+        self._animation.apply(index)
+
+        # only the rows of one tile are mapped at a time, so the memory used
+        # depends on the tile size; edge tiles reach past the image and are cut
+        for x, y in corners:
+            tile = engine.Tile(image_size, x, y, tile_size.width, tile_size.height)
+            self._engine.render_tile_into(tile, self._scene, self._tile_frame)
+
+            pixels = self._pixels(self._tile_frame, tile_size)
+            height, width = min(tile.height, image_size.height - y), min(tile.width, image_size.width - x)
+            rows = numpy.memmap(
+                job.frame_path(index, 'raw'), dtype=numpy.uint8, mode='r+',
+                offset=y * image_size.width * components, shape=(height, image_size.width, components),
+            )
+            rows[:, x:x + width] = pixels[:height, :width]
+            rows.flush()
+            del rows
+
+        return len(corners)
+
+
+# one worker per process, each with its own standalone context
+_worker: _Worker | None = None
+
+
+def _init_worker(job: Job) -> None:
+    global _worker
+    _worker = _Worker(job)
+
+
+def _render_chunk(indexes: range) -> int:
+    return _worker.render(indexes)
+
+
+def _render_tiles_chunk(task: tuple[int, list[tuple[int, int]]]) -> int:
+    return _worker.render_tiles(*task)
+
+
+# the raw image is read block by block, never all at once
+def _write_png_from_raw(job: Job, index: int) -> None:
+    size, components = job.canvas_size, job.pixel_format.components
+    rows = _png.block_rows(size.width, components)
+
+    with job.frame_path(index, 'raw').open('rb') as file:
+        blocks = (
+            numpy.fromfile(file, dtype=numpy.uint8, count=rows * size.width * components).reshape(-1, size.width, components)
+            for _ in range(0, size.height, rows)
+        )
+        _png.write_blocks(job.frame_path(index, 'png'), size.width, size.height, components, blocks, job.compression, job.png_order)
+
+
+# frames are rendered one after another, the tiles of each are spread over the workers
+def _render_tiled(job: Job, amount: int, workers: int) -> int:
+    image_size = job.canvas_size
+    corners = [
+        (x, y)
+        for y in range(0, image_size.height, job.tile_size)
+        for x in range(0, image_size.width, job.tile_size)
+    ]
+    chunk_size = max(1, len(corners) // (workers * 4))
+    chunks = [corners[start:start + chunk_size] for start in range(0, len(corners), chunk_size)]
+
+    executor = None
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(job,))
+    else:
+        _init_worker(job)
+
+    try:
+        for index in range(amount):
+            path = job.frame_path(index, 'raw')
+            with path.open('wb') as file:
+                file.truncate(image_size.width * image_size.height * job.pixel_format.components)
+
+            tasks = [(index, chunk) for chunk in chunks]
+            if executor is not None:
+                list(executor.map(_render_tiles_chunk, tasks))
+            else:
+                for task in tasks:
+                    _render_tiles_chunk(task)
+
+            if job.file_format == 'png':
+                _write_png_from_raw(job, index)
+                path.unlink()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return amount
+
+
+def render(job: Job, workers: int = 1, chunk_size: int | None = None) -> int:
+    amount = frames_amount(job.description)
+    job.output.mkdir(parents=True, exist_ok=True)
+
+    if job.tile_size is not None:
+        return _render_tiled(job, amount, workers)
+
+    if workers <= 1:
+        return _Worker(job).render(range(amount))
+
+    # a few chunks per worker keep all of them busy till the end
+    chunk_size = chunk_size or max(1, amount // (workers * 4))
+    chunks = [range(start, min(start + chunk_size, amount)) for start in range(0, amount, chunk_size)]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(job,)) as executor:
+        return sum(executor.map(_render_chunk, chunks))
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Render the frames of a scene description without a window')
+    parser.add_argument('scene', type=Path, help='scene description JSON file')
+    parser.add_argument('output', type=Path, help='directory the frames are written to')
+    parser.add_argument('--format', choices=('png', 'raw'), default='png', dest='file_format')
+    parser.add_argument('--pixel-format', choices=tuple(_PIXEL_FORMATS), default='rgb')
+    parser.add_argument('--name', default='frame_{index:05d}', help='frame file name pattern')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--compression', type=int, default=6, choices=range(10), metavar='0-9')
+    parser.add_argument('--tile-size', type=int, help='render frames in tiles of this many pixels')
+    args = parser.parse_args(argv)
+
+    job = Job(
+        description=load_description(args.scene),
+        base_path=args.scene.parent,
+        output=args.output,
+        file_format=args.file_format,
+        pixel_format=_PIXEL_FORMATS[args.pixel_format],
+        name_pattern=args.name,
+        compression=args.compression,
+        tile_size=args.tile_size,
+    )
+    amount = render(job, args.workers)
+    print(f'{amount} frames written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,10 @@
 import numpy
 
-from . import scene
-from ._renderer import Config, CanvasSize, Renderer, RenderMode, ProjectionType
+from . import scene, _projection
+from ._renderer import (
+    Config, CanvasSize, Renderer, RenderMode, ProjectionType, StreamingMesh, FrameStatistics,
+    FaceCulling, Winding, Frame, PixelFormat, Tile,
+)
 
 
 class Engine:
@@ -10,10 +13,47 @@ class Engine:
         self._renderer = Renderer(render_config)
     
     def render(self, canvas_size: CanvasSize, s: scene.Scene) -> numpy.ndarray:
-        triangles, lights = scene.dump_scene(s)
-        rendered_data = self._renderer.render(canvas_size, triangles, lights)
+        meshes, lights = scene.dump_scene(s)
+        rendered_data = self._renderer.render(canvas_size, meshes, lights)
         return rendered_data
 
+    # renders straight into `out`, e.g. a buffer from allocate_frame reused every frame
+    def render_into(self, canvas_size: CanvasSize, s: scene.Scene, out: numpy.ndarray) -> numpy.ndarray:
+        meshes, lights = scene.dump_scene(s)
+        return self._renderer.render_into(canvas_size, meshes, lights, out)
+
+    def render_tile_into(self, tile: Tile, s: scene.Scene, out: numpy.ndarray) -> numpy.ndarray:
+        meshes, lights = scene.dump_scene(s)
+        return self._renderer.render_tile_into(tile, meshes, lights, out)
+
+    def allocate_frame(self, canvas_size: CanvasSize) -> numpy.ndarray:
+        return self._renderer.allocate_frame(canvas_size)
+
+    def row_stride(self, canvas_size: CanvasSize) -> int:
+        return self._renderer.row_stride(canvas_size)
+
+    # pipelined rendering: the returned frame is the one submitted
+    # `readback_buffers - 1` calls earlier, see Config.readback_buffers
+    def render_async(self, canvas_size: CanvasSize, s: scene.Scene) -> Frame | None:
+        meshes, lights = scene.dump_scene(s)
+        return self._renderer.render_async(canvas_size, meshes, lights)
+
+    def finish(self) -> list[Frame]:
+        return self._renderer.finish()
+
+    # object under a canvas pixel, None when the ray from the camera hits nothing
+    def pick(self, canvas_size: CanvasSize, s: scene.Scene, point: tuple[int, int]) -> scene.SceneObject | None:
+        direction = _projection.screen_ray(
+            point, (canvas_size.width, canvas_size.height), self._render_config.view_size,
+        )
+        hit = s.ray_cast(numpy.zeros(3), direction)
+        return hit[0] if hit is not None else None
+
     @property
     def render_config(self) -> Config:
         return self._render_config
+
+    # counters of the last rendered frame, e.g. how many objects were culled
+    @property
+    def frame_statistics(self) -> FrameStatistics:
+        return self._renderer.statistics
@@ -0,0 +1,237 @@
+import functools
+import inspect
+from collections import OrderedDict
+from typing import Callable
+
+import numpy
+
+from . import types
+from .mesh import Mesh
+
+
+# generated meshes are shared by every caller asking for the same parameters,
+# so their arrays are made read-only; the least recently used ones are dropped
+_CACHE_SIZE = 32
+_cache: OrderedDict[tuple, Mesh] = OrderedDict()
+
+
+def _key_part(value) -> object:
+    if isinstance(value, types.Color):
+        return value.r, value.g, value.b, value.a
+    return value
+
+
+def _memoized(generator: Callable[..., Mesh]) -> Callable[..., Mesh]:
+    signature = inspect.signature(generator)
+
+    @functools.wraps(generator)
+    def wrapper(*args, **kwargs) -> Mesh:
+        # positional and keyword calls with the same values share an entry
+        arguments = signature.bind(*args, **kwargs).arguments
+        key = (generator.__name__, *map(_key_part, arguments.values()))
+        mesh = _cache.get(key)
+
+        if mesh is None:
+            mesh = generator(**arguments)
+            for name in ('positions', 'normals', 'colors', 'specular', 'indexes'):
+                getattr(mesh, name).setflags(write=False)
+
+            _cache[key] = mesh
+            if len(_cache) > _CACHE_SIZE:
+                _cache.popitem(last=False)
+        else:
+            _cache.move_to_end(key)
+
+        return mesh
+
+    return wrapper
+
+
+def clear_cache() -> None:
+    _cache.clear()
+
+
+# all generators fill float32 vertexes and uint32 triangles in place, so the
+# Mesh takes them without converting; triangles are clockwise seen from outside
+def _mesh(positions, normals, triangles, color: types.Color, specular: float) -> Mesh:
+    amount = len(positions)
+    return Mesh(
+        positions=positions,
+        normals=normals,
+        colors=numpy.tile(numpy.array([color.r, color.g, color.b], dtype=numpy.float32) / 255, (amount, 1)),
+        specular=numpy.full(amount, specular, dtype=numpy.float32),
+        indexes=triangles.reshape(-1),
+    )
+
+
+def _circle(n: int, closed: bool = False) -> tuple[numpy.ndarray, numpy.ndarray]:
+    # cosines and sines of n points around, the first one repeated at the end when closed
+    angles = numpy.linspace(0, 2 * numpy.pi, n + 1 if closed else n, endpoint=closed)
+    return numpy.cos(angles), numpy.sin(angles)
+
+
+def _middle_angles(n: int) -> numpy.ndarray:
+    # angles halfway between the consecutive points of _circle
+    return numpy.pi / n * (2 * numpy.arange(n) + 1)
+
+
+def _fan(triangles: numpy.ndarray, center: int, first: int, n: int, reverse: bool = False) -> None:
+    # n triangles around `center` over the ring first..first + n, clockwise
+    # seen from where the ring goes counterclockwise, unless reversed
+    ring = numpy.arange(first, first + n, dtype=numpy.uint32)
+    triangles[:, 1] = center
+    triangles[:, 2 if reverse else 0] = ring
+    triangles[:, 0 if reverse else 2] = ring + 1
+
+
+def _grid(rows: int, columns: int) -> numpy.ndarray:
+    # (rows, columns, 2, 3) triangles over a (rows + 1) x (columns + 1) vertex grid stored
+    # row by row; clockwise when the cross product of the row and column directions points outside
+    corners = (numpy.arange(rows, dtype=numpy.uint32)[:, None] * numpy.uint32(columns + 1)
+               + numpy.arange(columns, dtype=numpy.uint32))
+    triangles = numpy.empty((rows, columns, 2, 3), dtype=numpy.uint32)
+    triangles[:, :, :, 0] = corners[..., None]
+    triangles[:, :, 0, 1] = corners + 1
+    triangles[:, :, 0, 2] = triangles[:, :, 1, 1] = corners + (columns + 2)
+    triangles[:, :, 1, 2] = corners + (columns + 1)
+    return triangles
+
+
+# n points around with the last one on top of the first, smooth normals along the radius
+@_memoized
+def cylinder(r: float, h: float, n: int, color: types.Color, specular: float) -> Mesh:
+    angles = numpy.linspace(0, 2 * numpy.pi, n)
+
+    # top points take indexes [0, n), bottom points take [n, 2n)
+    points = numpy.empty((2, n, 3), dtype=numpy.float32)
+    points[:, :, 0] = r * numpy.cos(angles)
+    points[:, :, 1] = r * numpy.sin(angles)
+    points[0, :, 2], points[1, :, 2] = h / 2, -h / 2
+    points = points.reshape(-1, 3)
+
+    # top cap, bottom cap, then two triangles per side
+    triangles = numpy.empty((4 * n - 6, 3), dtype=numpy.uint32)
+    top_cap, bottom_cap = triangles[:n - 2], triangles[n - 2:2 * n - 4]
+    sides = triangles[2 * n - 4:].reshape(n - 1, 2, 3)
+
+    caps = numpy.arange(1, n - 1, dtype=numpy.uint32)
+    top_cap[:, 0], top_cap[:, 1], top_cap[:, 2] = caps, 0, caps + 1
+    bottom_cap[:, 0], bottom_cap[:, 1], bottom_cap[:, 2] = n, caps + n, caps + (n + 1)
+
+    top = numpy.arange(n - 1, dtype=numpy.uint32)
+    bottom = top + n
+    sides[:, 0, 0], sides[:, 0, 1], sides[:, 0, 2] = bottom, top, top + 1
+    sides[:, 1, 0], sides[:, 1, 1], sides[:, 1, 2] = bottom + 1, bottom, top + 1
+
+    return _mesh(points, points, triangles, color, specular)
+
+
+# apex at +h / 2, base of radius r at -h / 2, n segments around
+@_memoized
+def cone(r: float, h: float, n: int, color: types.Color, specular: float) -> Mesh:
+    cos, sin = _circle(n, closed=True)
+    middle = _middle_angles(n)
+    slope = numpy.hypot(r, h)
+
+    # side ring [0, n], apexes [n + 1, 2n + 1) one per segment so that each takes
+    # the normal halfway through it, base ring [2n + 1, 3n + 2), base center 3n + 2
+    points = numpy.zeros((3 * n + 3, 3), dtype=numpy.float32)
+    normals = numpy.zeros_like(points)
+    side, apexes, base = slice(0, n + 1), slice(n + 1, 2 * n + 1), slice(2 * n + 1, 3 * n + 3)
+
+    points[side, 0], points[side, 1], points[side, 2] = r * cos, r * sin, -h / 2
+    normals[side, 0], normals[side, 1], normals[side, 2] = h * cos / slope, h * sin / slope, r / slope
+
+    points[apexes, 2] = h / 2
+    normals[apexes, 0] = h * numpy.cos(middle) / slope
+    normals[apexes, 1] = h * numpy.sin(middle) / slope
+    normals[apexes, 2] = r / slope
+
+    points[base][:-1] = points[side]
+    points[base, 2] = -h / 2
+    normals[base, 2] = -1.0
+
+    triangles = numpy.empty((2 * n, 3), dtype=numpy.uint32)
+    ring = numpy.arange(n, dtype=numpy.uint32)
+    triangles[:n, 0], triangles[:n, 1], triangles[:n, 2] = ring, ring + (n + 1), ring + 1
+    _fan(triangles[n:], 3 * n + 2, 2 * n + 1, n, reverse=True)
+
+    return _mesh(points, normals, triangles, color, specular)
+
+
+# n segments around the z axis, n / 2 rings from pole to pole
+@_memoized
+def sphere(r: float, n: int, color: types.Color, specular: float) -> Mesh:
+    rings = max(n // 2, 2)
+    cos, sin = _circle(n, closed=True)
+    polar = numpy.linspace(0, numpy.pi, rings + 1)
+
+    normals = numpy.empty((rings + 1, n + 1, 3), dtype=numpy.float32)
+    normals[..., 0] = numpy.sin(polar)[:, None] * cos
+    normals[..., 1] = numpy.sin(polar)[:, None] * sin
+    normals[..., 2] = numpy.cos(polar)[:, None]
+    normals = normals.reshape(-1, 3)
+
+    # the cells next to the poles have one of their triangles collapsed
+    grid = _grid(rings, n)
+    triangles = numpy.concatenate([grid[0, :, 1], grid[1:-1].reshape(-1, 3), grid[-1, :, 0]])
+
+    return _mesh(r * normals, normals, triangles, color, specular)
+
+
+# ring of radius `major` around the z axis, tube of radius `minor`,
+# n segments along the ring and m around the tube
+@_memoized
+def torus(major: float, minor: float, n: int, m: int, color: types.Color, specular: float) -> Mesh:
+    ring_cos, ring_sin = _circle(n, closed=True)
+    tube_cos, tube_sin = _circle(m, closed=True)
+
+    normals = numpy.empty((n + 1, m + 1, 3), dtype=numpy.float32)
+    normals[..., 0] = ring_cos[:, None] * tube_cos
+    normals[..., 1] = ring_sin[:, None] * tube_cos
+    normals[..., 2] = tube_sin
+
+    positions = minor * normals
+    positions[..., 0] += major * ring_cos[:, None]
+    positions[..., 1] += major * ring_sin[:, None]
+
+    return _mesh(positions.reshape(-1, 3), normals.reshape(-1, 3), _grid(n, m), color, specular)
+
+
+# regular n-gon of circumradius r extruded along z, flat shaded
+@_memoized
+def prism(r: float, h: float, n: int, color: types.Color, specular: float) -> Mesh:
+    cos, sin = _circle(n, closed=True)
+    middle = _middle_angles(n)
+
+    # every side owns 4 vertexes (top i, bottom i, top i + 1, bottom i + 1),
+    # then come the top and the bottom caps: n ring vertexes and the center each
+    points = numpy.zeros((4 * n + 2 * (n + 1), 3), dtype=numpy.float32)
+    normals = numpy.zeros_like(points)
+
+    sides, side_normals = points[:4 * n].reshape(n, 2, 2, 3), normals[:4 * n].reshape(n, 2, 2, 3)
+    sides[:, 0, :, 0], sides[:, 0, :, 1] = (r * cos[:-1])[:, None], (r * sin[:-1])[:, None]
+    sides[:, 1, :, 0], sides[:, 1, :, 1] = (r * cos[1:])[:, None], (r * sin[1:])[:, None]
+    sides[:, :, 0, 2], sides[:, :, 1, 2] = h / 2, -h / 2
+    side_normals[..., 0] = numpy.cos(middle)[:, None, None]
+    side_normals[..., 1] = numpy.sin(middle)[:, None, None]
+
+    caps, cap_normals = points[4 * n:].reshape(2, n + 1, 3), normals[4 * n:].reshape(2, n + 1, 3)
+    caps[:, :n, 0], caps[:, :n, 1] = r * cos[:-1], r * sin[:-1]
+    caps[0, :, 2], caps[1, :, 2] = h / 2, -h / 2
+    cap_normals[0, :, 2], cap_normals[1, :, 2] = 1.0, -1.0
+
+    triangles = numpy.empty((4 * n, 3), dtype=numpy.uint32)
+    side_triangles = triangles[:2 * n].reshape(n, 2, 3)
+    first = numpy.arange(0, 4 * n, 4, dtype=numpy.uint32)
+    side_triangles[:, 0, 0], side_triangles[:, 0, 1], side_triangles[:, 0, 2] = first + 1, first, first + 2
+    side_triangles[:, 1, 0], side_triangles[:, 1, 1], side_triangles[:, 1, 2] = first + 1, first + 2, first + 3
+
+    # the last cap triangles close the rings back to their first vertexes
+    top, bottom = 4 * n, 5 * n + 1
+    _fan(triangles[2 * n:3 * n], top + n, top, n)
+    _fan(triangles[3 * n:], bottom + n, bottom, n, reverse=True)
+    triangles[3 * n - 1, 2] = top
+    triangles[4 * n - 1, 0] = bottom
+
+    return _mesh(points, normals, triangles, color, specular)
@@ -0,0 +1,154 @@
+from dataclasses import dataclass
+from typing import Callable, Sequence
+
+import numpy
+
+from . import _projection
+from .mesh import Mesh, Bounds
+
+
+# a level is used while the object covers at most `max_screen_size` pixels across
+@dataclass
+class LodLevel:
+    mesh: Mesh
+    max_screen_size: float
+
+
+# levels of detail of one model, from the finest to the coarsest; a chain can be
+# used as the mesh of a scene object, the renderer picks the level every frame
+@dataclass(eq=False)
+class LodChain:
+    levels: Sequence[LodLevel]
+    # share of a threshold the screen size must cross before the level changes
+    hysteresis: float = 0.2
+
+    def __post_init__(self) -> None:
+        self.levels = tuple(self.levels)
+
+        if not self.levels:
+            raise ValueError('LOD chain must contain at least one level')
+
+    @classmethod
+    def procedural(
+        cls,
+        generator: Callable[[int], Mesh],
+        segments: int,
+        min_segments: int = 8,
+        pixels_per_segment: float = 4.0,
+    ) -> 'LodChain':
+        # the segments amount is halved level by level, a level with n segments
+        # around keeps them about `pixels_per_segment` long on screen
+        amounts = [segments]
+        while amounts[-1] // 2 >= min_segments:
+            amounts.append(amounts[-1] // 2)
+
+        return cls([
+            LodLevel(generator(n), numpy.inf if i == 0 else n * pixels_per_segment / numpy.pi)
+            for i, n in enumerate(amounts)
+        ])
+
+    @classmethod
+    def simplified(
+        cls,
+        mesh: Mesh,
+        cells: Sequence[int] = (64, 32, 16, 8, 4),
+        pixels_per_cell: float = 2.0,
+    ) -> 'LodChain':
+        levels = [LodLevel(mesh, numpy.inf)]
+
+        for cells_amount in sorted(cells, reverse=True):
+            simplified = simplify(mesh, cells_amount)
+
+            # coarser grids stop paying off once the triangles amount doesn't drop
+            if len(simplified) and len(simplified) < len(levels[-1].mesh):
+                levels.append(LodLevel(simplified, cells_amount * pixels_per_cell))
+
+        return cls(levels)
+
+    @property
+    def finest(self) -> Mesh:
+        return self.levels[0].mesh
+
+    # coarser levels stay inside the bounds of the finest one
+    @property
+    def bounds(self) -> Bounds:
+        return self.finest.bounds
+
+    def __len__(self) -> int:
+        return len(self.finest)
+
+    def select(self, screen_sizes: numpy.ndarray, previous: numpy.ndarray) -> numpy.ndarray:
+        # levels for the screen sizes, `previous` holds the current levels (-1 for none);
+        # a coarser level is taken once the size is well below its threshold,
+        # the current one is kept until the size is well above its threshold
+        thresholds = numpy.array([level.max_screen_size for level in self.levels])
+        ideal = len(self.levels) - numpy.searchsorted(thresholds[::-1], screen_sizes, side='left') - 1
+        ideal = numpy.clip(ideal, 0, len(self.levels) - 1)
+
+        relaxed = len(self.levels) - numpy.searchsorted(
+            thresholds[::-1] * (1.0 - self.hysteresis), screen_sizes, side='left',
+        ) - 1
+        relaxed = numpy.clip(relaxed, 0, len(self.levels) - 1)
+
+        previous = numpy.minimum(previous, len(self.levels) - 1)
+        current = numpy.where(previous < 0, ideal, previous)
+        too_coarse = screen_sizes > thresholds[current] * (1.0 + self.hysteresis)
+
+        levels = numpy.where(relaxed > current, relaxed, current)
+        return numpy.where(too_coarse | (previous < 0), ideal, levels)
+
+
+# diameter in pixels of the bounding spheres, inf for spheres crossing the camera plane
+def screen_sizes(
+    centers: numpy.ndarray,
+    radiuses: numpy.ndarray,
+    canvas_size: tuple[int, int],
+    view_size: tuple[float, float],
+) -> numpy.ndarray:
+    scale = _projection.view_scale(view_size)
+    pixels_per_unit = max(scale[0] * canvas_size[0], scale[1] * canvas_size[1]) / 2
+    depths = numpy.abs(centers[:, 2])
+
+    with numpy.errstate(divide='ignore'):
+        sizes = 2.0 * radiuses / depths * pixels_per_unit
+    return numpy.where(depths > radiuses, sizes, numpy.inf)
+
+
+# vertex clustering: vertexes are merged per cell of a `cells`^3 grid over
+# the mesh box, triangles that collapse are dropped
+def simplify(mesh: Mesh, cells: int) -> Mesh:
+    if not len(mesh):
+        return mesh
+
+    bounds = mesh.bounds
+    positions = numpy.asarray(mesh.positions, dtype=numpy.float64)
+    extent = numpy.where(bounds.maximum > bounds.minimum, bounds.maximum - bounds.minimum, 1.0)
+
+    grid = numpy.minimum(((positions - bounds.minimum) / extent * cells).astype(numpy.int64), cells - 1)
+    keys = (grid[:, 0] * cells + grid[:, 1]) * cells + grid[:, 2]
+    clusters, vertex_clusters = numpy.unique(keys, return_inverse=True)
+    vertex_clusters = vertex_clusters.reshape(-1)
+
+    counts = numpy.bincount(vertex_clusters, minlength=len(clusters))
+
+    def average(values: numpy.ndarray) -> numpy.ndarray:
+        values = numpy.asarray(values, dtype=numpy.float64).reshape(len(positions), -1)
+        return numpy.stack([
+            numpy.bincount(vertex_clusters, weights=column, minlength=len(clusters)) / counts
+            for column in values.T
+        ], axis=1)
+
+    triangles = vertex_clusters[mesh.indexes.reshape(-1, 3)]
+    kept = (
+        (triangles[:, 0] != triangles[:, 1])
+        & (triangles[:, 1] != triangles[:, 2])
+        & (triangles[:, 2] != triangles[:, 0])
+    )
+
+    return Mesh(
+        positions=average(positions),
+        normals=average(mesh.normals),
+        colors=average(mesh.colors),
+        specular=average(mesh.specular).reshape(-1),
+        indexes=triangles[kept].reshape(-1),
+    )
@@ -0,0 +1,185 @@
+from dataclasses import InitVar, dataclass
+from functools import cached_property
+from typing import Iterable, Iterator
+
+import numpy
+
+from . import types
+
+
+def _as_array(data: Iterable, width: int | None, dtype=numpy.float32) -> numpy.ndarray:
+    array = numpy.ascontiguousarray(data, dtype=dtype)
+    return array.reshape((-1, width) if width is not None else (-1,))
+
+
+@dataclass
+class Bounds:
+    # axis aligned box and a sphere around it, both in model space
+    minimum: numpy.ndarray
+    maximum: numpy.ndarray
+    center: numpy.ndarray
+    radius: float
+    # the render shader moves vertexes by their specular, culling accounts for it
+    max_specular: float = 0.0
+
+    @classmethod
+    def from_box(cls, minimum: numpy.ndarray, maximum: numpy.ndarray, max_specular: float = 0.0) -> 'Bounds':
+        center = (minimum + maximum) / 2
+        return cls(minimum, maximum, center, float(numpy.linalg.norm(maximum - center)), max_specular)
+
+    @property
+    def corners(self) -> numpy.ndarray:
+        # (8, 3), every combination of minimum and maximum coordinates
+        box = numpy.stack([self.minimum, self.maximum])
+        return box[numpy.indices((2, 2, 2)).reshape(3, -1).T, [0, 1, 2]]
+
+
+@dataclass(eq=False)
+class Mesh:
+    # structure of arrays: one row per unique vertex, every three
+    # consecutive values of `indexes` form a triangle
+    positions: numpy.ndarray
+    normals: numpy.ndarray
+    colors: numpy.ndarray
+    specular: numpy.ndarray
+    indexes: numpy.ndarray
+    # meshes mapped back from the model cache compare the largest index stored with
+    # them instead, looking for it here would read the whole mapped array
+    _trusted: InitVar[bool] = False
+
+    def __post_init__(self, _trusted: bool) -> None:
+        self.positions = _as_array(self.positions, 3)
+        self.normals = _as_array(self.normals, 3)
+        self.colors = _as_array(self.colors, 3)
+        self.specular = _as_array(self.specular, None)
+        self.indexes = _as_array(self.indexes, None, numpy.uint32)
+
+        vertexes_amount = len(self.positions)
+
+        for name in ('normals', 'colors', 'specular'):
+            if len(getattr(self, name)) != vertexes_amount:
+                raise ValueError(f'Mesh {name} length does not match positions length')
+
+        if len(self.indexes) % 3 != 0:
+            raise ValueError(f'Mesh must contain whole triangles, got {len(self.indexes)} indexes')
+
+        if not _trusted and len(self.indexes) and self.indexes.max() >= vertexes_amount:
+            raise ValueError('Mesh indexes refer to missing vertexes')
+
+    @classmethod
+    def empty(cls) -> 'Mesh':
+        return cls(
+            numpy.empty((0, 3)), numpy.empty((0, 3)),
+            numpy.empty((0, 3)), numpy.empty((0,)),
+            numpy.empty((0,)),
+        )
+
+    @classmethod
+    def from_corners(
+        cls,
+        positions: numpy.ndarray,
+        normals: numpy.ndarray,
+        colors: numpy.ndarray,
+        specular: numpy.ndarray,
+    ) -> 'Mesh':
+        # builds an indexed mesh from a triangle soup, every three rows
+        # describe one triangle and equal rows are merged into one vertex
+        corners = numpy.concatenate([
+            _as_array(positions, 3), _as_array(normals, 3),
+            _as_array(colors, 3), _as_array(specular, 1),
+        ], axis=1)
+
+        if not len(corners):
+            return cls.empty()
+
+        vertexes, indexes = numpy.unique(corners, axis=0, return_inverse=True)
+
+        return cls(
+            positions=vertexes[:, 0:3],
+            normals=vertexes[:, 3:6],
+            colors=vertexes[:, 6:9],
+            specular=vertexes[:, 9],
+            indexes=indexes.reshape(-1),
+        )
+
+    @classmethod
+    def from_triangles(cls, triangles: Iterable[types.Triangle]) -> 'Mesh':
+        triangles = tuple(triangles)
+
+        if not triangles:
+            return cls.empty()
+
+        return cls.from_corners(
+            positions=[list(point) for triangle in triangles for point in triangle.points],
+            normals=[list(normal) for triangle in triangles for normal in triangle.normals],
+            colors=numpy.repeat(
+                [[t.color.r / 255, t.color.g / 255, t.color.b / 255] for t in triangles],
+                3, axis=0,
+            ),
+            specular=numpy.repeat([t.specular for t in triangles], 3),
+        )
+
+    def __len__(self) -> int:
+        return len(self.indexes) // 3
+
+    def __iter__(self) -> Iterator[types.Triangle]:
+        # compatibility view for the code written against tuples of triangles
+        colors = numpy.rint(self.colors * 255).astype(int)
+
+        for corners in self.indexes.reshape(-1, 3):
+            yield types.Triangle(
+                points=tuple(types.Vector3(*map(float, self.positions[i])) for i in corners),
+                normals=tuple(types.Vector3(*map(float, self.normals[i])) for i in corners),
+                color=types.Color(*map(int, colors[corners[0]])),
+                specular=float(self.specular[corners[0]]),
+            )
+
+    # computed on first use, meshes are not modified after they are built
+    @cached_property
+    def bounds(self) -> Bounds:
+        if not len(self.positions):
+            return Bounds.from_box(numpy.zeros(3), numpy.zeros(3))
+
+        positions = numpy.asarray(self.positions, dtype=numpy.float64)
+        bounds = Bounds.from_box(
+            positions.min(axis=0), positions.max(axis=0),
+            float(numpy.abs(self.specular).max()),
+        )
+        # the sphere around the vertexes is tighter than the one around the box
+        bounds.radius = float(numpy.sqrt(((positions - bounds.center) ** 2).sum(axis=1).max()))
+        return bounds
+
+    # (T, 3) triangle normals following the winding, not normalized,
+    # and (T,) plane offsets: a point p is on the normal side when n @ p > offset
+    @cached_property
+    def face_planes(self) -> tuple[numpy.ndarray, numpy.ndarray]:
+        triangles = numpy.asarray(self.positions, dtype=numpy.float64)[self.indexes.reshape(-1, 3)]
+        normals = numpy.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+        return normals, (normals * triangles[:, 0]).sum(axis=1)
+
+    # distance along the ray to the closest triangle, the direction does not have
+    # to be normalized and the distance is measured in its lengths
+    def ray_intersection(self, origin: numpy.ndarray, direction: numpy.ndarray) -> float | None:
+        if not len(self):
+            return None
+
+        triangles = numpy.asarray(self.positions, dtype=numpy.float64)[self.indexes.reshape(-1, 3)]
+        first, second = triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0]
+
+        # Moller-Trumbore, both faces of the triangles are hit
+        p = numpy.cross(direction, second)
+        determinant = (first * p).sum(axis=1)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            inverse = 1.0 / determinant
+            t_vector = origin - triangles[:, 0]
+            u = (t_vector * p).sum(axis=1) * inverse
+            q = numpy.cross(t_vector, first)
+            v = (q @ direction) * inverse
+            distances = (q * second).sum(axis=1) * inverse
+
+        hit = (determinant != 0.0) & (u >= 0.0) & (v >= 0.0) & (u + v <= 1.0) & (distances >= 0.0)
+        return float(distances[hit].min()) if hit.any() else None
+
+    @property
+    def triangles(self) -> tuple[types.Triangle, ...]:
+        return tuple(self)
@@ -1,47 +1,178 @@
-from itertools import starmap
-
-from . import types, scene
-
-
-def load(filepath: str) -> scene.Mesh:
-    materials = dict()
-    vertexes = []
-    faces = []
-
-    current_material = ''
-
-    with open(filepath, 'r') as file:
-        for line in map(str.strip, file):
-            if not line:
-                continue
-
-            object_type, *data = line.split()
-
-            if object_type == 'v':
-                vertexes.append(tuple(map(float, data)))
-            
-            elif object_type == 'usemtl':
-                current_material = data[0]
-            
-            elif object_type == 'f':
-                faces.append((current_material, tuple(map(int, data))))
-            
-            elif object_type == 'newmtl':
-                alias = data[0]
-                _, *data = file.readline().strip().split()
-                materials[alias] = tuple(map(float, data))
-
-
-        materials = {alias: types.Color(*map(lambda x: int(x * 255), data)) for alias, data in materials.items()}
-        vertexes = tuple(starmap(types.Vector3, vertexes))
-        zero_normal = types.Vector3(0.0, 0.0, 0.0)
-        faces = [
-            types.Triangle(
-                points=tuple(map(lambda i: vertexes[i - 1 if i >= 0 else i], point_indexes)),
-                normals=(zero_normal, zero_normal, zero_normal),
-                color=materials.get(material_alias, types.Color(0, 0, 0)),
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+import numpy
+
+from . import scene, types, _obj, _mesh_cache
+from ._obj import ObjParseError
+
+
+# with `cache` enabled the parsed arrays are kept in a `.meshcache` sidecar file
+# next to the model and memory-mapped by later loads of the unchanged model;
+# `workers` > 1 parses parts of the file in that many processes
+def load(filepath: str, cache: bool = True, workers: int = 1) -> scene.Mesh:
+    path = Path(filepath)
+
+    if cache:
+        mesh = _mesh_cache.load(path)
+        if mesh is not None:
+            return mesh
+
+    if workers > 1:
+        mesh, libraries = _obj.load_parallel(path, workers)
+    else:
+        chunk = _obj.parse_chunk(path.read_bytes())
+        mesh, libraries = _obj.assemble([chunk], path.parent)
+
+    if cache:
+        _mesh_cache.store(path, mesh, libraries)
+
+    return mesh
+
+
+@dataclass
+class MeshChunk:
+    # 'positions', 'normals', 'colors' or 'indexes'
+    attribute: str
+    # in rows of the attribute: vertexes, or single indexes for 'indexes'
+    offset: int
+    data: numpy.ndarray
+    progress: float
+
+
+@dataclass
+class MeshStream:
+    vertexes_amount: int
+    triangles_amount: int
+    chunks: Iterator[MeshChunk]
+
+    def __iter__(self) -> Iterator[MeshChunk]:
+        return self.chunks
+
+
+# out-of-core loading: host memory is bounded by `chunk_size` records, while
+# positions and normal sums are kept in temporary memory-mapped files.
+# Every `v` record becomes one vertex painted with `color` (materials are
+# ignored); positions and indexes are streamed while the file is parsed, so
+# the part of the model read so far can already be drawn, and normals, which
+# need all faces, are streamed at the end
+def stream(filepath: str, chunk_size: int = 1 << 16, color: types.Color = types.Color(255, 255, 255)) -> MeshStream:
+    path = Path(filepath)
+    block_size = chunk_size * 32
+    vertexes_amount = normals_amount = triangles_amount = 0
+
+    for _, data in _obj.read_blocks(path, block_size):
+        vertexes, normals, triangles = _obj.count_chunk(data)
+        vertexes_amount += vertexes
+        normals_amount += normals
+        triangles_amount += triangles
+
+    return MeshStream(
+        vertexes_amount=vertexes_amount,
+        triangles_amount=triangles_amount,
+        chunks=_stream_chunks(path, block_size, chunk_size, color, vertexes_amount, normals_amount),
+    )
+
+
+def _split(attribute: str, offset: int, data: numpy.ndarray, chunk_size: int, progress: float) -> Iterator[MeshChunk]:
+    for start in range(0, len(data), chunk_size):
+        yield MeshChunk(attribute, offset + start, data[start:start + chunk_size], progress)
+
+
+def _stream_chunks(
+    path: Path,
+    block_size: int,
+    chunk_size: int,
+    color: types.Color,
+    vertexes_amount: int,
+    normals_amount: int,
+) -> Iterator[MeshChunk]:
+    color = numpy.array([color.r / 255, color.g / 255, color.b / 255], dtype=numpy.float32)
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as directory:
+        directory = Path(directory)
+        positions = numpy.memmap(directory / 'positions', dtype=numpy.float32, mode='w+', shape=(max(vertexes_amount, 1), 3))
+        normals = numpy.memmap(directory / 'normals', dtype=numpy.float32, mode='w+', shape=(max(normals_amount, 1), 3))
+        normal_sums = numpy.memmap(directory / 'normal_sums', dtype=numpy.float32, mode='w+', shape=(max(vertexes_amount, 1), 3))
+
+        try:
+            yield from _stream_records(
+                path, block_size, chunk_size, color, vertexes_amount, positions, normals, normal_sums,
             )
-            for material_alias, point_indexes in faces
-        ]
-    
-    return scene.Mesh(faces)
+        finally:
+            # memory maps have to be closed before the temporary directory is removed
+            del positions, normals, normal_sums
+
+
+def _stream_records(
+    path: Path,
+    block_size: int,
+    chunk_size: int,
+    color: numpy.ndarray,
+    vertexes_amount: int,
+    positions: numpy.memmap,
+    normals: numpy.memmap,
+    normal_sums: numpy.memmap,
+) -> Iterator[MeshChunk]:
+    file_size = max(path.stat().st_size, 1)
+    vertexes_offset = normals_offset = indexes_offset = 0
+
+    for offset, data in _obj.read_blocks(path, block_size):
+        chunk = _obj.parse_chunk(data)
+        progress = 0.9 * (offset + len(data)) / file_size
+
+        positions[vertexes_offset:vertexes_offset + len(chunk.positions)] = chunk.positions
+        normals[normals_offset:normals_offset + len(chunk.normals)] = chunk.normals
+        yield from _split('positions', vertexes_offset, chunk.positions, chunk_size, progress)
+        yield from _split('colors', vertexes_offset, numpy.tile(color, (len(chunk.positions), 1)), chunk_size, progress)
+
+        vertexes_offset += len(chunk.positions)
+        normals_offset += len(chunk.normals)
+
+        triangles = _obj.fan_triangulate(chunk.face_sizes)
+        corner_positions = chunk.corner_positions + chunk.corner_positions_relative * (vertexes_offset - len(chunk.positions))
+        corner_normals = chunk.corner_normals + chunk.corner_normals_relative * (normals_offset - len(chunk.normals))
+
+        if len(corner_positions) and (corner_positions.min() < 0 or corner_positions.max() >= vertexes_offset):
+            raise ObjParseError('face refers to a vertex which is not read yet')
+
+        if len(corner_normals) and (corner_normals.max() >= normals_offset or corner_normals.min() < -1):
+            raise ObjParseError('face refers to a normal which is not read yet')
+
+        triangles_positions = corner_positions[triangles]
+        triangles_normals = corner_normals[triangles]
+        _accumulate_normals(positions, normals, normal_sums, triangles_positions, triangles_normals)
+
+        indexes = triangles_positions.reshape(-1).astype(numpy.uint32)
+        yield from _split('indexes', indexes_offset, indexes, chunk_size, progress)
+        indexes_offset += len(indexes)
+
+    for start in range(0, vertexes_amount, chunk_size):
+        sums = numpy.array(normal_sums[start:start + chunk_size])
+        lengths = numpy.linalg.norm(sums, axis=1, keepdims=True)
+        progress = 0.9 + 0.1 * min(start + chunk_size, vertexes_amount) / vertexes_amount
+        yield MeshChunk('normals', start, sums / numpy.where(lengths == 0.0, 1.0, lengths), progress)
+
+
+# vertexes take the sum of their vn records, or of the adjacent face normals when a corner has no vn
+def _accumulate_normals(positions, normals, normal_sums, triangles_positions, triangles_normals) -> None:
+    if not len(triangles_positions):
+        return
+
+    corners = positions[triangles_positions]
+    face_normals = numpy.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    contributions = numpy.repeat(face_normals[:, None, :], 3, axis=1)
+
+    has_normal = triangles_normals != -1
+    contributions[has_normal] = normals[triangles_normals[has_normal]]
+
+    vertexes, inverse = numpy.unique(triangles_positions.reshape(-1), return_inverse=True)
+    contributions = contributions.reshape(-1, 3)
+    sums = numpy.stack([
+        numpy.bincount(inverse.reshape(-1), weights=contributions[:, axis], minlength=len(vertexes))
+        for axis in range(3)
+    ], axis=1)
+
+    normal_sums[vertexes] += sums.astype(numpy.float32)
@@ -1,61 +1,92 @@
-import copy
-import itertools
-from typing import Iterable, NewType
+import weakref
 from dataclasses import dataclass
+from typing import Iterable, Iterator
+
 import numpy
 
-from . import types, _light
+from . import types, _light, _bvh, _projection
+from ._observable import Observable
+from .mesh import Mesh
+from .lod import LodChain
 
 
-Mesh = NewType('Mesh', tuple[types.Triangle, ...])
+# objects compare and hash by identity: scenes index them in dicts, and
+# a field by field comparison would walk whole meshes
+@dataclass(eq=False)
+class ObjectBase(Observable):
+    name: str
 
+    # the version also lets caches built from an object be checked for
+    # staleness with one comparison
+    def __setattr__(self, name: str, value) -> None:
+        previous = self.__dict__.get(name)
+        super().__setattr__(name, value)
 
-@dataclass
-class ObjectBase:
-    name: str
+        # scenes holding the object keep their indexes up to date
+        # and tell their own subscribers about the change
+        if not name.startswith('_'):
+            for owner in list(self.__dict__.get('_scenes', ())):
+                if name == 'name':
+                    owner._rename(self, previous)
+                owner._object_changed(self)
 
 
-@dataclass
+@dataclass(eq=False)
 class SceneObject(ObjectBase):
     rotation: types.Vector3
     position: types.Vector3
     scale: types.Vector3
-    mesh: Mesh
+    mesh: Mesh | LodChain
+    # per-object overrides of the mesh color and specular, so copies
+    # of one mesh can differ without duplicating its vertexes
+    color: types.Color | None = None
+    specular: float | None = None
 
 
-@dataclass
+@dataclass(eq=False)
 class Light(ObjectBase):
     intensity: float
 
 
-@dataclass
+@dataclass(eq=False)
 class AmbientLight(Light):
     pass
 
 
-@dataclass
+@dataclass(eq=False)
 class PointLight(Light):
     position: types.Vector3
 
 
-@dataclass
+@dataclass(eq=False)
 class DirectionalLight(Light):
     direction: types.Vector3
 
 
-def _translate(scene_object: SceneObject, triangles: Iterable[types.Triangle]) -> Iterable[types.Triangle]:
-    for triangle in triangles:
-        triangle.points = tuple(point + scene_object.position for point in triangle.points)
-        yield triangle
+# instance buffer row: model matrix (16), normal matrix (9),
+# color override with a use flag (4) and specular override (1)
+INSTANCE_SIZE = 30
 
 
-def _scale(scene_object: SceneObject, triangles: Iterable[types.Triangle]) -> Iterable[types.Triangle]:
-    for triangle in triangles:
-        triangle.points = tuple(point.dot(scene_object.scale) for point in triangle.points)
-        yield triangle
+# a new dumped object is made whenever the object changes, so caches derived
+# from its matrices can be keyed by its identity
+@dataclass(eq=False)
+class DumpedObject:
+    mesh: Mesh
+    model: numpy.ndarray
+    normal: numpy.ndarray
+    instance: numpy.ndarray
+    source: 'SceneObject'
+
+
+# objects sharing one mesh are drawn with a single instanced draw call
+@dataclass
+class DumpedMesh:
+    mesh: Mesh
+    objects: tuple[DumpedObject, ...]
+    instances: numpy.ndarray
 
 
-# TODO: rewrite using scipy
 def _get_matrix(index: int, angle: float) -> numpy.ndarray:
     samples = [
         [
@@ -75,78 +106,242 @@ def _get_matrix(index: int, angle: float) -> numpy.ndarray:
         ],
     ]
 
-    return numpy.array(samples[index], dtype=numpy.float16)
+    return numpy.array(samples[index], dtype=numpy.float64)
+
+
+def _rotation_matrix(rotation: types.Vector3) -> numpy.ndarray:
+    # points are rotated as row vectors: p @ Rx @ Ry @ Rz,
+    # which is (Rx @ Ry @ Rz).T @ p for column vectors
+    matrix = numpy.identity(3)
+
+    for i, angle in enumerate(rotation):
+        matrix = matrix @ _get_matrix(i, angle)
+
+    return matrix.transpose()
+
+
+# points are scaled, rotated and then translated; normals are only rotated
+# and corrected for non-uniform scale, so a uniform scale keeps their length
+def _model_matrices(scene_object: SceneObject) -> tuple[numpy.ndarray, numpy.ndarray]:
+    rotation = _rotation_matrix(scene_object.rotation)
+    scale = numpy.array(list(scene_object.scale), dtype=numpy.float64)
+
+    model = numpy.identity(4)
+    model[:3, :3] = rotation * scale
+    model[:3, 3] = list(scene_object.position)
+
+    safe_scale = numpy.where(scale == 0.0, 1.0, scale)
+    normal = rotation * (numpy.abs(safe_scale).max() / safe_scale)
 
+    return model.astype(numpy.float32), normal.astype(numpy.float32)
 
-def _rotate(scene_object: SceneObject, triangles: Iterable[types.Triangle]) -> Iterable[types.Triangle]:
-    for triangle in triangles:
-        points = []
-        normals = []
 
-        for point, normal in zip(triangle.points, triangle.normals):
-            pos = numpy.array([list(point)], dtype=numpy.float16)
-            n = numpy.array([list(normal)], dtype=numpy.float16)
+def _pack_instance(scene_object: SceneObject, model: numpy.ndarray, normal: numpy.ndarray) -> numpy.ndarray:
+    instance = numpy.zeros(INSTANCE_SIZE, dtype=numpy.float32)
 
-            for i, angle in enumerate(scene_object.rotation):
-                rotation_matrix = _get_matrix(i, angle)
-                pos = numpy.matmul(pos, rotation_matrix)
-                n = numpy.matmul(n, rotation_matrix, n)
+    # GLSL matrices are column-major, numpy arrays are row-major
+    instance[0:16] = model.T.reshape(-1)
+    instance[16:25] = normal.T.reshape(-1)
 
-            points.append(types.Vector3(*pos[0]))
-            normals.append(types.Vector3(*n[0]))
+    if scene_object.color is not None:
+        color = scene_object.color
+        instance[25:29] = (color.r / 255, color.g / 255, color.b / 255, 1.0)
 
-        yield types.Triangle(tuple(points), tuple(normals), triangle.color, triangle.specular)
+    # negative specular keeps the one of the mesh
+    instance[29] = scene_object.specular if scene_object.specular is not None else -1.0
+    return instance
 
 
-def _dump_scene_object(scene_object: SceneObject) -> Iterable[types.Triangle]:
-    triangles = iter(copy.deepcopy(scene_object.mesh))
+def _dump_scene_object(scene_object: SceneObject) -> DumpedObject:
+    cached = scene_object.__dict__.get('_dump_cache')
 
-    triangles = _scale(scene_object, triangles)
-    triangles = _rotate(scene_object, triangles)
-    triangles = _translate(scene_object, triangles)
+    if cached is not None and cached[0] == scene_object.version:
+        return cached[1]
 
-    return triangles
+    model, normal = _model_matrices(scene_object)
+    instance = _pack_instance(scene_object, model, normal)
+    dumped_object = DumpedObject(scene_object.mesh, model, normal, instance, scene_object)
 
+    scene_object._dump_cache = (scene_object.version, dumped_object)
+    return dumped_object
 
-class Scene:
+
+# axis aligned world boxes around the objects whose meshes have bounds, the
+# transforms of _model_matrices computed for all of them at once
+def _world_boxes(scene_objects: Iterable[SceneObject]) -> tuple[list[SceneObject], numpy.ndarray, numpy.ndarray]:
+    bounded = [obj for obj in scene_objects if obj.mesh.bounds is not None and len(obj.mesh)]
+    rows = numpy.array(
+        [(*obj.rotation, *obj.scale, *obj.position) for obj in bounded], dtype=numpy.float64,
+    ).reshape(-1, 9)
+    angles, scales, positions = rows[:, 0:3], rows[:, 3:6], rows[:, 6:9]
+
+    cos, sin = numpy.cos(angles), numpy.sin(angles)
+    rotations = numpy.zeros((3, len(bounded), 3, 3))
+    for axis, (first, second) in enumerate(((1, 2), (2, 0), (0, 1))):
+        rotations[axis, :, axis, axis] = 1.0
+        rotations[axis, :, first, first] = rotations[axis, :, second, second] = cos[:, axis]
+        rotations[axis, :, first, second] = -sin[:, axis]
+        rotations[axis, :, second, first] = sin[:, axis]
+    models = (rotations[0] @ rotations[1] @ rotations[2]).transpose(0, 2, 1) * scales[:, None, :]
+
+    bounds = [obj.mesh.bounds for obj in bounded]
+    centers = numpy.array([b.center for b in bounds], dtype=numpy.float64).reshape(-1, 3)
+    halves = numpy.array([(b.maximum - b.minimum) / 2 for b in bounds], dtype=numpy.float64).reshape(-1, 3)
+
+    centers = numpy.einsum('nij,nj->ni', models, centers) + positions
+    extents = numpy.einsum('nij,nj->ni', numpy.abs(models), halves)
+    return bounded, centers - extents, centers + extents
+
+
+def _discard(index: dict[object, dict[ObjectBase, None]], key: object, scene_object: ObjectBase) -> None:
+    objects = index.get(key)
+
+    if objects is not None:
+        objects.pop(scene_object, None)
+        if not objects:
+            del index[key]
+
+
+# the version changes with the set of objects and with every change of an object in it
+class Scene(Observable):
     def __init__(self):
-        self._objects = []
-        self._lights = []
+        # dicts are used as insertion ordered sets of objects
+        self._objects: dict[SceneObject, None] = {}
+        self._lights: dict[Light, None] = {}
+        self._names: dict[str, dict[ObjectBase, None]] = {}
+        self._types: dict[type, dict[ObjectBase, None]] = {}
+        self._lights_cache = None
+        # spatial index over the object boxes, objects added or changed since
+        # the last query are put in it on the next one
+        self._hierarchy = _bvh.BoundingVolumeHierarchy()
+        self._changed: dict[SceneObject, None] = {}
+        # objects with streamed meshes, whose bounds and triangles grow without the
+        # objects changing, and the bounds and triangles amount they were indexed with
+        self._growing: dict[SceneObject, tuple[object, int]] = {}
 
     def add_object(self, scene_object: ObjectBase) -> None:
         objects_container = self._objects if isinstance(scene_object, SceneObject) else self._lights
 
         if scene_object not in objects_container:
-            objects_container.append(scene_object)
+            objects_container[scene_object] = None
+            self._names.setdefault(scene_object.name, {})[scene_object] = None
+            self._types.setdefault(type(scene_object), {})[scene_object] = None
 
-    def get_by_name(self, name: str) -> ObjectBase | None:
-        for obj in itertools.chain(self._objects, self._lights):
-            if obj.name == name:
-                return obj
-        return None
+            if '_scenes' not in scene_object.__dict__:
+                scene_object._scenes = weakref.WeakSet()
+            scene_object._scenes.add(self)
+            self._object_changed(scene_object)
 
+    def remove_object(self, scene_object: ObjectBase) -> None:
+        objects_container = self._objects if isinstance(scene_object, SceneObject) else self._lights
 
-def _dump_triangles(triangles: Iterable[types.Triangle]) -> numpy.ndarray:
-    dumped_triangles = []
+        if scene_object not in objects_container:
+            return
 
-    for triangle in triangles:
-        color = [triangle.color.r / 255, triangle.color.g / 255, triangle.color.b / 255]
+        del objects_container[scene_object]
+        scene_object._scenes.discard(self)
 
-        for point, normal in zip(triangle.points, triangle.normals):
-            point = list(point)
-            normal = list(normal)
-            dumped_triangles.append([*point, *normal, *color, 0.0, triangle.specular])
+        for index, key in ((self._names, scene_object.name), (self._types, type(scene_object))):
+            _discard(index, key, scene_object)
 
-    return numpy.concatenate(dumped_triangles, axis=0).astype('f4')
+        self._changed.pop(scene_object, None)
+        self._growing.pop(scene_object, None)
+        self._hierarchy.remove(scene_object)
+        self._bump_version()
 
+    def _object_changed(self, scene_object: ObjectBase) -> None:
+        if scene_object in self._objects:
+            self._changed[scene_object] = None
+        self._bump_version()
+
+    def _rename(self, scene_object: ObjectBase, previous_name: str) -> None:
+        _discard(self._names, previous_name, scene_object)
+        self._names.setdefault(scene_object.name, {})[scene_object] = None
+
+    def __contains__(self, scene_object: ObjectBase) -> bool:
+        return scene_object in self._objects or scene_object in self._lights
+
+    # the first object added with the name
+    def get_by_name(self, name: str) -> ObjectBase | None:
+        return next(iter(self._names.get(name, ())), None)
+
+    # objects of the type and of its subclasses, in the order they were added
+    def objects_of_type(self, object_type: type) -> Iterator[ObjectBase]:
+        for registered_type, objects in list(self._types.items()):
+            if issubclass(registered_type, object_type):
+                yield from objects
+
+    # puts the objects changed since the last query in the hierarchy in one batch
+    def _sync_hierarchy(self) -> _bvh.BoundingVolumeHierarchy:
+        # a stream may upload all of its positions before the first triangle, so
+        # the bounds stay the same while the object joins the hierarchy
+        for scene_object, (bounds, triangles_amount) in self._growing.items():
+            if scene_object.mesh.bounds is not bounds or len(scene_object.mesh) != triangles_amount:
+                self._changed[scene_object] = None
+
+        if not self._changed:
+            return self._hierarchy
+
+        for scene_object in self._changed:
+            if isinstance(scene_object.mesh, (Mesh, LodChain)):
+                self._growing.pop(scene_object, None)
+            else:
+                self._growing[scene_object] = (scene_object.mesh.bounds, len(scene_object.mesh))
+
+        bounded, minimum, maximum = _world_boxes(self._changed)
+        for scene_object in self._changed.keys() - set(bounded):
+            self._hierarchy.remove(scene_object)
+
+        self._changed.clear()
+        self._hierarchy.insert_many(bounded, minimum, maximum)
+        return self._hierarchy
+
+    # objects whose boxes may reach the screen for the given Config.view_size
+    def objects_in_view(self, view_size: tuple[float, float]) -> list[SceneObject]:
+        scale = _projection.view_scale(view_size)
+        return self._sync_hierarchy().query(lambda minimum, maximum: _projection.visible_boxes(minimum, maximum, scale))
+
+    # closest object hit by the ray and the distance in direction lengths;
+    # meshes are tested triangle by triangle, streamed ones by their boxes
+    def ray_cast(self, origin: numpy.ndarray, direction: numpy.ndarray) -> tuple[SceneObject, float] | None:
+        origin, direction = numpy.asarray(origin, dtype=numpy.float64), numpy.asarray(direction, dtype=numpy.float64)
+        best = None
+
+        for entry, scene_object in self._sync_hierarchy().ray_cast(origin, direction):
+            if best is not None and entry > best[1]:
+                break
+
+            distance = entry
+            mesh = scene_object.mesh.finest if isinstance(scene_object.mesh, LodChain) else scene_object.mesh
+
+            if isinstance(mesh, Mesh):
+                model = _dump_scene_object(scene_object).model.astype(numpy.float64)
+                if abs(numpy.linalg.det(model)) > 1e-12:
+                    inverse = numpy.linalg.inv(model)
+                    distance = mesh.ray_intersection(
+                        inverse[:3, :3] @ origin + inverse[:3, 3], inverse[:3, :3] @ direction,
+                    )
+
+            if distance is not None and (best is None or distance < best[1]):
+                best = (scene_object, distance)
+
+        return best
+
+    # object with the closest box to the point
+    def nearest(self, point: numpy.ndarray) -> SceneObject | None:
+        found = self._sync_hierarchy().nearest(point)
+        return found[1] if found is not None else None
+
+
+# the same tuple is returned while no light changes, which lets the renderer
+# skip rewriting its light uniforms
+def _dump_lights(scene: Scene) -> tuple[_light.Light, ...]:
+    versions = tuple((id(light), light.version) for light in scene._lights)
+    if scene._lights_cache is not None and scene._lights_cache[0] == versions:
+        return scene._lights_cache[1]
 
-def dump_scene(scene: Scene) -> tuple[numpy.ndarray, tuple[Light, ...]]:
     lights = []
-    triangles = []
 
-    for scene_object in scene._objects:
-        triangles.extend(_dump_scene_object(scene_object))
-    
     for light_object in scene._lights:
         if isinstance(light_object, AmbientLight):
             lights.append(_light.AmbientLight(light_object.intensity))
@@ -154,5 +349,24 @@ def dump_scene(scene: Scene) -> tuple[numpy.ndarray, tuple[Light, ...]]:
             lights.append(_light.PointLight(light_object.intensity, light_object.position))
         elif isinstance(light_object, DirectionalLight):
             lights.append(_light.DirectionalLight(light_object.intensity, light_object.direction))
-    
-    return _dump_triangles(triangles), tuple(lights)
+
+    scene._lights_cache = (versions, tuple(lights))
+    return scene._lights_cache[1]
+
+
+def _group_by_mesh(objects: Iterable[DumpedObject]) -> tuple[DumpedMesh, ...]:
+    groups: dict[Mesh, list[DumpedObject]] = {}
+
+    # meshes are compared by identity, copies of one template share a group
+    for dumped_object in objects:
+        groups.setdefault(dumped_object.mesh, []).append(dumped_object)
+
+    return tuple(
+        DumpedMesh(mesh, tuple(group), numpy.stack([obj.instance for obj in group]))
+        for mesh, group in groups.items()
+    )
+
+
+def dump_scene(scene: Scene) -> tuple[tuple[DumpedMesh, ...], tuple[_light.Light, ...]]:
+    objects = (_dump_scene_object(scene_object) for scene_object in scene._objects if len(scene_object.mesh))
+    return _group_by_mesh(objects), _dump_lights(scene)
@@ -0,0 +1,94 @@
+import math
+import time
+from typing import Callable
+
+
+# paces the frames of a viewer: invalidations between two ticks are merged into
+# one frame, frames start on a grid of 1 / target_fps seconds, and the grid
+# points missed while a frame took too long are dropped instead of caught up;
+# the toolkit only needs a timer waking it up after `delay()`
+class FrameScheduler:
+    def __init__(self, target_fps: float = 60.0, clock: Callable[[], float] = time.perf_counter):
+        self.target_fps = target_fps
+        self._clock = clock
+        self._pending = False
+        self._invalidated_at = 0.0
+        self._next_frame = None
+        self.rendered_frames = 0
+        self.dropped_frames = 0
+
+    @property
+    def frame_interval(self) -> float:
+        return 1.0 / self.target_fps
+
+    @property
+    def pending(self) -> bool:
+        return self._pending
+
+    def invalidate(self) -> None:
+        if not self._pending:
+            self._pending = True
+            self._invalidated_at = self._clock()
+
+    # seconds until a pending frame may start
+    def delay(self) -> float:
+        if self._next_frame is None:
+            return 0.0
+        return max(0.0, self._next_frame - self._clock())
+
+    # whether a frame has to be rendered right now, called on every timer tick
+    def begin_frame(self) -> bool:
+        now = self._clock()
+
+        if not self._pending or (self._next_frame is not None and now < self._next_frame):
+            return False
+
+        if self._next_frame is None or now - self._next_frame >= self.frame_interval:
+            # idle for a while or fell behind: the grid restarts from now, the frames
+            # that were due since the invalidation count as dropped
+            if self._next_frame is not None:
+                late = now - max(self._next_frame, self._invalidated_at)
+                self.dropped_frames += math.floor(late / self.frame_interval)
+            self._next_frame = now
+
+        self._next_frame += self.frame_interval
+        self._pending = False
+        self.rendered_frames += 1
+        return True
+
+
+# picks the share of the viewer resolution to render at while the user interacts,
+# so that frames fit into `frame_budget` seconds; the cost of a frame is taken
+# as proportional to its amount of pixels, and the scale moves in `step`s
+# so that frame buffers are not reallocated on every frame; the first frame
+# after a change pays for the reallocation, so it is not measured
+class ResolutionScaler:
+    def __init__(self, frame_budget: float, min_scale: float = 0.25, step: float = 0.125):
+        self.frame_budget = frame_budget
+        self.min_scale = min_scale
+        self.step = step
+        self.scale = 1.0
+        self._resized = False
+
+    def scaled_size(self, width: int, height: int) -> tuple[int, int]:
+        return max(1, round(width * self.scale)), max(1, round(height * self.scale))
+
+    # takes the time the last frame rendered at the current scale took
+    def update(self, frame_time: float) -> float:
+        if self._resized or frame_time <= 0.0:
+            self._resized = False
+            return self.scale
+
+        target = self.scale * math.sqrt(self.frame_budget / frame_time)
+
+        # going down reacts at once, going up needs half a step of headroom
+        # so that the scale does not flip between two steps
+        if target < self.scale:
+            scale = math.floor(target / self.step) * self.step
+        else:
+            scale = max(self.scale, math.floor((target - self.step / 2) / self.step) * self.step)
+
+        scale = min(1.0, max(self.min_scale, scale))
+        self._resized = scale != self.scale
+        self.scale = scale
+        return self.scale
@@ -1,18 +1,99 @@
 #version 330
 
+// keep equal to MAX_LIGHTS in _light.py
+const int MAX_LIGHTS = 16;
+
+const int AMBIENT_LIGHT = 0;
+const int POINT_LIGHT = 1;
+const int DIRECTIONAL_LIGHT = 2;
+
 uniform vec2 viewSize;
+// (center x, center y, half width, half height) of the part of the view drawn into
+// the frame, (0, 0, 1, 1) draws all of it; tiles of large images take a smaller part
+uniform vec4 viewWindow;
+
+uniform int lightsAmount;
+uniform int lightTypes[MAX_LIGHTS];
+uniform float lightIntensities[MAX_LIGHTS];
+uniform vec3 lightVectors[MAX_LIGHTS];
 
 in vec3 in_vert;
 in vec3 in_normal;
 in vec3 in_color;
-in float in_intensity;
 in float in_specular;
 
+// per instance
+in mat4 in_model;
+in mat3 in_normal_matrix;
+in vec4 in_instance_color; // rgb is used when w is 1
+in float in_instance_specular; // negative keeps the vertex specular
+
+float specular;
+
 out vec3 frag_color;
 out float frag_intensity;
 
+float point_light(float intensity, vec3 position, vec3 vert, vec3 normal) {
+    vec3 L = position - vert;
+    float n_dot_l = dot(normal, L);
+    float result = 0.0;
+
+    if (n_dot_l > 0.0) {
+        result += n_dot_l / (length(normal) * length(L));
+    }
+
+    if (specular != 0.0) {
+        vec3 R = normal * 2 * dot(normal, L) - L;
+        float r_dot_v = dot(R, -position);
+
+        if (r_dot_v > 0.0) {
+            result += pow(r_dot_v / (length(R) * length(position)), specular);
+        }
+    }
+
+    return intensity * result;
+}
+
+float directional_light(float intensity, vec3 direction, vec3 vert, vec3 normal) {
+    float n_dot_l = dot(normal, direction);
+    float result = 0.0;
+
+    if (n_dot_l > 0) {
+        result += intensity * n_dot_l / (length(normal) * length(direction));
+    }
+
+    if (specular != 0.0) {
+        vec3 R = normal * 2 * dot(normal, direction) - direction;
+        float r_dot_v = dot(R, -vert);
+
+        if (r_dot_v > 0.0) {
+            result += pow(r_dot_v / (length(R) * length(vert)), specular);
+        }
+    }
+
+    return intensity * result;
+}
+
 void main() {
-    vec3 v = in_vert + 0.00001 * in_normal / length(in_normal) + 0.00001 * in_specular * vec3(0.0, 1.0, 0.0);
+    // light is computed in world space
+    vec3 vert = (in_model * vec4(in_vert, 1.0)).xyz;
+    vec3 normal = in_normal_matrix * in_normal;
+    specular = in_instance_specular < 0.0 ? in_specular : in_instance_specular;
+    float intensity = 0.0;
+
+    for (int i = 0; i < lightsAmount; i++) {
+        if (lightTypes[i] == AMBIENT_LIGHT) {
+            intensity += lightIntensities[i];
+        } else if (lightTypes[i] == POINT_LIGHT) {
+            intensity += point_light(lightIntensities[i], lightVectors[i], vert, normal);
+        } else if (lightTypes[i] == DIRECTIONAL_LIGHT) {
+            intensity += directional_light(lightIntensities[i], lightVectors[i], vert, normal);
+        }
+    }
+
+    // normals may be zero, e.g. while a streamed mesh is still loading
+    vec3 unit_normal = length(normal) > 0.0 ? normal / length(normal) : vec3(0.0);
+    vec3 v = vert + 0.00001 * unit_normal + 0.00001 * specular * vec3(0.0, 1.0, 0.0);
     v = vec3(v.x / v.z, -v.y / v.z, v.z / 100.0); // project point on view
 
     // fit point coordinates to viewSize
@@ -22,7 +103,7 @@ void main() {
         v = vec3(v.x, v.y / viewSize.y, v.z);
     }
 
-    gl_Position = vec4(v, 1.0);
-    frag_color = in_color;
-    frag_intensity = in_intensity;
+    gl_Position = vec4((v.xy - viewWindow.xy) / viewWindow.zw, v.z, 1.0);
+    frag_color = mix(in_color, in_instance_color.rgb, in_instance_color.w);
+    frag_intensity = intensity;
 }
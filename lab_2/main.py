@@ -1,13 +1,15 @@
 import math
 import sys
+import time
 import os
+import numpy as np
 
-from PyQt5.QtCore import QSize, Qt
+from PyQt5.QtCore import QRect, QSize, Qt, QTimer
 from PyQt5.QtGui import QPainter, QMouseEvent, QPaintEvent, QWheelEvent, QResizeEvent, QImage, QColor, QFont
 from PyQt5.QtWidgets import QApplication, QWidget, QFrame, QVBoxLayout, QHBoxLayout
 from PyQt5.QtWidgets import QDoubleSpinBox, QComboBox, QLabel, QSpacerItem, QSizePolicy
 
-from engine import engine, scene, types, model
+from engine import engine, scheduler, scene, types, model
 
 
 CURDIR_PATH = os.path.split(__file__)[0]
@@ -108,6 +110,8 @@ class SettingsWidget(QWidget):
         super().__init__()
         self._engine = _engine
         self.__object = _scene.get_by_name('pyramid')
+        # the values are refreshed from the scene only when it changes
+        _scene.on_change(lambda _: self.update())
 
         main_layout = QVBoxLayout()
         self.__init_widgets(main_layout)
@@ -196,8 +200,6 @@ class SettingsWidget(QWidget):
         self._widgets_map['rotation.y'].setValue(self._normalize(self.__object.rotation.y))
         self._widgets_map['rotation.z'].setValue(self._normalize(self.__object.rotation.z))
 
-        self.update()
-
     def __init_widgets(self, layout: QVBoxLayout):
         self._widgets_map = dict()
 
@@ -260,6 +262,16 @@ class SettingsWidget(QWidget):
 
 
 class Canvas(QFrame):
+    # ARGB32 is stored as B, G, R, A bytes on little-endian machines
+    _IMAGE_FORMAT = {
+        engine.PixelFormat.RGB: QImage.Format_RGB888,
+        engine.PixelFormat.RGBA: QImage.Format_RGBA8888,
+        engine.PixelFormat.BGRA: QImage.Format_ARGB32,
+    }
+    _TARGET_FPS = 60.0
+    # full resolution comes back after this many milliseconds without input
+    _IDLE_DELAY = 500
+
     def __init__(self, parent: QWidget, _engine: engine.Engine, scene: scene.Scene) -> None:
         super().__init__(parent)
         self.setMinimumSize(QSize(400, 400))
@@ -267,12 +279,85 @@ class Canvas(QFrame):
 
         self._engine = _engine
         self._scene = scene
+        # frames are rendered straight into the memory of the image,
+        # both are only recreated when the size or the pixel format changes
+        self._frame_layout = None
+        self._frame = None
+        self._image = None
+
+        # frames are drawn on demand after a change of the scene or the render config,
+        # at most one per tick of the scheduler; paints requested by Qt in between
+        # (e.g. on expose) show the last frame
+        self._scheduler = scheduler.FrameScheduler(self._TARGET_FPS)
+        self._render_requested = True
+        self._frame_timer = QTimer()
+        self._frame_timer.setSingleShot(True)
+        self._frame_timer.timeout.connect(self._on_frame_timer)
+
+        self._scene.on_change(lambda _: self._invalidate())
+        self._engine.render_config.on_change(lambda _: self._invalidate())
+
+        # while the user drags or scrolls frames are rendered at a lower resolution
+        # fitting the frame interval and stretched over the canvas
+        self._resolution = scheduler.ResolutionScaler(self._scheduler.frame_interval)
+        self._interacting = False
+        self._frame_rect = None
+        self._idle_timer = QTimer()
+        self._idle_timer.setSingleShot(True)
+        self._idle_timer.timeout.connect(self._on_idle)
+
+        self._bind_handlers(self._scene.get_by_name('pyramid'))
+
+    def _bind_handlers(self, obj: scene.SceneObject) -> None:
+        self._selected = obj
+        self._move_handler = UserMoveActionHandler(obj)
+        self._rotate_handler = UserRotateActionHandler(obj)
+        self._scale_handler = UserScaleAction(obj)
+
+    # the object under the cursor becomes the target of the handlers,
+    # a click on the background keeps the previous one
+    def _select(self, point: tuple[int, int]) -> None:
+        canvas_size = engine.CanvasSize(self.size().width(), self.size().height())
+        picked = self._engine.pick(canvas_size, self._scene, point)
+
+        if picked is not None and picked is not self._selected:
+            self._bind_handlers(picked)
+
+    def _invalidate(self) -> None:
+        self._scheduler.invalidate()
+        self._schedule_frame()
+
+    def _schedule_frame(self) -> None:
+        if self._scheduler.pending and not self._frame_timer.isActive():
+            self._frame_timer.start(round(self._scheduler.delay() * 1000))
+
+    def _on_frame_timer(self) -> None:
+        if self._scheduler.begin_frame():
+            self._render_requested = True
+            self.repaint()
+        self._schedule_frame()
+
+    def _interact(self) -> None:
+        self._interacting = True
+        self._idle_timer.start(self._IDLE_DELAY)
 
-        pyramid = self._scene.get_by_name('pyramid')
+    def _on_idle(self) -> None:
+        self._interacting = False
+        self._invalidate()
 
-        self._move_handler = UserMoveActionHandler(pyramid)
-        self._rotate_handler = UserRotateActionHandler(pyramid)
-        self._scale_handler = UserScaleAction(pyramid)
+    def _get_frame(self, canvas_size: engine.CanvasSize) -> np.ndarray:
+        config = self._engine.render_config
+        layout = (canvas_size.width, canvas_size.height, config.pixel_format, config.row_alignment)
+
+        if layout != self._frame_layout:
+            self._frame = self._engine.allocate_frame(canvas_size)
+            self._image = QImage(
+                self._frame.data, canvas_size.width, canvas_size.height,
+                self._engine.row_stride(canvas_size), self._IMAGE_FORMAT[config.pixel_format],
+            )
+            self._frame_layout = layout
+
+        return self._frame
 
     def put_pixel(self, image: QImage, point: tuple[int, int], color: QColor) -> None:
         image.setPixelColor(point[0], point[1], color)
@@ -281,16 +366,27 @@ class Canvas(QFrame):
         painter = QPainter()
         painter.begin(self)
 
-        canvas_size = engine.CanvasSize(self.size().width(), self.size().height())
-        rendered_data = self._engine.render(canvas_size, self._scene)
-        image = QImage(rendered_data.data, canvas_size.width, canvas_size.height, 4 * canvas_size.width, QImage.Format_RGBA8888)
-        painter.drawImage(0, 0, image)
-        painter.end()
+        if self._render_requested:
+            width, height = self.size().width(), self.size().height()
+            if self._interacting:
+                canvas_size = engine.CanvasSize(*self._resolution.scaled_size(width, height))
+            else:
+                canvas_size = engine.CanvasSize(width, height)
 
-        self.update()
+            started = time.perf_counter()
+            self._engine.render_into(canvas_size, self._scene, self._get_frame(canvas_size))
+            if self._interacting:
+                self._resolution.update(time.perf_counter() - started)
+
+            self._frame_rect = QRect(0, 0, width, height)
+            self._render_requested = False
+
+        painter.drawImage(self._frame_rect, self._image)
+        painter.end()
 
     def mousePressEvent(self, event: QMouseEvent) -> None:
         point = (event.pos().x(), event.pos().y())
+        self._select(point)
 
         if event.button() == Qt.LeftButton:
             self._move_handler.start(point)
@@ -298,6 +394,9 @@ class Canvas(QFrame):
             self._rotate_handler.start(point)
 
     def mouseMoveEvent(self, event: QMouseEvent) -> None:
+        if event.buttons() & (Qt.LeftButton | Qt.RightButton):
+            self._interact()
+
         point = (event.pos().x(), event.pos().y())
         self._move_handler.update(point)
         self._rotate_handler.update(point)
@@ -308,6 +407,8 @@ class Canvas(QFrame):
 
     def wheelEvent(self, event: QWheelEvent) -> None:
         direction = [-1, 1][event.angleDelta().y() >= 0]
+        self._interact()
+        self._select((event.pos().x(), event.pos().y()))
         self._scale_handler.update(direction)
 
     def resizeEvent(self, event: QResizeEvent) -> None:
@@ -324,6 +425,8 @@ class MainWindow(QWidget):
             view_size=(1.0, 1.0),
             mode=engine.RenderMode.FILL,
             projection=engine.ProjectionType.PERSPECTIVE,
+            pixel_format=engine.PixelFormat.RGBA,
+            row_alignment=4,
         )
 
         self._engine = engine.Engine(self._render_config)
@@ -0,0 +1,33 @@
+import pytest
+
+from engine import engine, geometry, scene, types
+
+
+@pytest.fixture
+def render_config() -> engine.Config:
+    return engine.Config(
+        d=1.0, view_size=(1.0, 1.0), mode=engine.RenderMode.FILL, projection=engine.ProjectionType.PERSPECTIVE,
+    )
+
+
+# the renderer needs an OpenGL 3.3 context, tests drawing frames are skipped without one
+@pytest.fixture
+def render_engine(render_config: engine.Config) -> engine.Engine:
+    try:
+        return engine.Engine(render_config)
+    except Exception as error:
+        pytest.skip(f'no OpenGL context: {error}')
+
+
+@pytest.fixture
+def cylinder_scene() -> scene.Scene:
+    s = scene.Scene()
+    s.add_object(scene.SceneObject(
+        name='cylinder',
+        rotation=types.Vector3(0.3, 0.5, 0.1),
+        position=types.Vector3(0.0, 0.0, 5.0),
+        scale=types.Vector3(1.0, 1.0, 1.0),
+        mesh=geometry.cylinder(1.0, 2.0, 50, types.Color(0, 255, 0), 500.0),
+    ))
+    s.add_object(scene.AmbientLight('ambient-light', 0.5))
+    return s
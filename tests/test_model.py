@@ -0,0 +1,60 @@
+import os
+
+import numpy
+
+from engine import model, _mesh_cache
+
+
+_OBJ = '''mtllib square.mtl
+v 0 0 0
+v 1 0 0
+v 1 1 0
+v 0 1 0
+usemtl red
+f 1 2 3
+f 1 3 4
+'''
+
+
+def _write_model(directory, red: str) -> str:
+    (directory / 'square.obj').write_text(_OBJ)
+    (directory / 'square.mtl').write_text(f'newmtl red\nKd {red} 0 0\n')
+    return str(directory / 'square.obj')
+
+
+def test_cache_follows_material_library_changes(tmp_path):
+    path = _write_model(tmp_path, '1')
+    assert numpy.allclose(model.load(path).colors[:, 0], 1.0)
+    assert _mesh_cache.sidecar_path(tmp_path / 'square.obj').exists()
+
+    library = tmp_path / 'square.mtl'
+    library.write_text('newmtl red\nKd 0.5 0 0\n')
+    stat = library.stat()
+    os.utime(library, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    assert numpy.allclose(model.load(path).colors[:, 0], 0.5)
+
+
+def test_truncated_sidecar_is_parsed_again(tmp_path):
+    path = _write_model(tmp_path, '1')
+    expected = model.load(path)
+
+    sidecar = _mesh_cache.sidecar_path(tmp_path / 'square.obj')
+    sidecar.write_bytes(sidecar.read_bytes()[:-40])
+
+    mesh = model.load(path)
+    assert numpy.array_equal(mesh.indexes, expected.indexes)
+    assert numpy.array_equal(mesh.positions, expected.positions)
+
+
+def test_sidecar_with_indexes_past_the_vertexes_is_a_miss(tmp_path):
+    path = _write_model(tmp_path, '1')
+    mesh = model.load(path)
+    assert _mesh_cache.load(tmp_path / 'square.obj') is not None
+
+    sidecar = _mesh_cache.sidecar_path(tmp_path / 'square.obj')
+    maximum = int(mesh.indexes.max())
+    data = sidecar.read_bytes().replace(f'"index_maximum": {maximum}'.encode(), b'"index_maximum": 9')
+    sidecar.write_bytes(data)
+
+    assert _mesh_cache.load(tmp_path / 'square.obj') is None
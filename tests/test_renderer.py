@@ -0,0 +1,26 @@
+import numpy
+
+from engine import engine
+
+
+def test_render_after_canvas_resize(render_engine, cylinder_scene):
+    sizes = [engine.CanvasSize(100, 80), engine.CanvasSize(120, 90), engine.CanvasSize(100, 80)]
+    frames = [render_engine.render(size, cylinder_scene) for size in sizes]
+
+    for size, frame in zip(sizes, frames):
+        assert frame.size == size.width * size.height * 3
+
+    assert numpy.array_equal(frames[0], frames[2])
+
+
+def test_async_frames_survive_lowered_readback_depth(render_engine, render_config, cylinder_scene):
+    size = engine.CanvasSize(32, 32)
+    render_config.readback_buffers = 3
+    frames = [render_engine.render_async(size, cylinder_scene) for _ in range(4)]
+
+    render_config.readback_buffers = 1
+    frames += [render_engine.render_async(size, cylinder_scene) for _ in range(4)]
+    frames += render_engine.finish()
+
+    frame_ids = [frame.frame_id for frame in frames if frame is not None]
+    assert frame_ids == list(range(frame_ids[0], frame_ids[0] + 8))
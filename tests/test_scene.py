@@ -0,0 +1,36 @@
+import numpy
+import pytest
+
+from engine import engine, model, scene, types
+
+
+def _stream(chunks: list[model.MeshChunk], vertexes_amount: int, triangles_amount: int) -> engine.StreamingMesh:
+    try:
+        return engine.StreamingMesh(model.MeshStream(vertexes_amount, triangles_amount, iter(chunks)))
+    except Exception as error:
+        pytest.skip(f'no OpenGL context: {error}')
+
+
+def test_streamed_object_joins_hierarchy_once_faces_arrive():
+    positions = numpy.array([[-1, -1, 0], [1, -1, 0], [0, 1, 0]], dtype=numpy.float32)
+    mesh = _stream([
+        model.MeshChunk('positions', 0, positions, 0.5),
+        model.MeshChunk('indexes', 0, numpy.array([0, 1, 2], dtype=numpy.uint32), 1.0),
+    ], 3, 1)
+
+    s = scene.Scene()
+    streamed = scene.SceneObject(
+        'streamed', types.Vector3(0, 0, 0), types.Vector3(0, 0, 5), types.Vector3(1, 1, 1), mesh,
+    )
+    s.add_object(streamed)
+
+    # positions only: bounded, but nothing to draw or hit yet
+    mesh.load()
+    assert mesh.bounds is not None and len(mesh) == 0
+    assert s.objects_in_view((1.0, 1.0)) == []
+
+    mesh.load()
+    assert len(mesh) == 1
+    assert s.objects_in_view((1.0, 1.0)) == [streamed]
+    assert s.ray_cast(numpy.zeros(3), numpy.array([0.0, 0.0, 1.0]))[0] is streamed
+    assert s.nearest(numpy.zeros(3)) is streamed